@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Mikro-benchmark for parsing av erklæringssider (scrape_uustatus.extract_fields).
+
+Bruk:
+  python bench_uu_parse.py                  # sider fra HTTP-cachen (.cache/uu-http)
+  python bench_uu_parse.py sider/ a.html    # lagrede .html-filer / kataloger
+  python bench_uu_parse.py --repeat 20
+  python bench_uu_parse.py --check          # bare regresjonssjekken (brukes i CI)
+
+Sammenligner mot den gamle BeautifulSoup/get_text-varianten og sjekker
+at begge gir samme felt. Sjekker også at sider uten elementer (bare doctype,
+kommentar eller XML-deklarasjon) gir tomme felt i stedet for et unntak.
+"""
+import argparse, json, re, sys, time
+from datetime import datetime
+from pathlib import Path
+
+import scrape_uustatus as su
+import uu_fetch
+
+
+def load_pages(paths):
+    pages = []
+    for p in paths:
+        p = Path(p)
+        files = sorted(p.rglob("*")) if p.is_dir() else [p]
+        for fp in files:
+            if fp.suffix in (".html", ".htm"):
+                pages.append((fp.name, fp.read_text(encoding="utf-8", errors="replace")))
+            elif fp.suffix == ".json":
+                try:
+                    entry = json.loads(fp.read_text(encoding="utf-8"))
+                except Exception:
+                    continue
+                if isinstance(entry, dict) and isinstance(entry.get("body"), str):
+                    pages.append((entry.get("url") or fp.name, entry["body"]))
+    return pages
+
+
+# Sider uten elementer: lxml kaster "Document is empty", bs4 ga tomme felt
+EMPTY_BODIES = ["", "  \n", "<!DOCTYPE html>", "<!DOCTYPE html><!-- maintenance -->",
+                "<!-- vedlikehold -->", "<?xml version='1.0'?>"]
+EMPTY_FIELDS = {"brudd": "", "krav": "", "updated": "", "created": "", "codes": []}
+
+
+def check_empty_bodies():
+    """-> liste med feil (tom liste = ok)."""
+    errors = []
+    for html in EMPTY_BODIES:
+        try:
+            got = su.extract_fields(html)
+        except Exception as e:
+            errors.append(f"{html!r}: {type(e).__name__}: {e}")
+            continue
+        if got != EMPTY_FIELDS:
+            errors.append(f"{html!r}: {got}")
+    return errors
+
+
+LEGACY_MONTHS = {
+    "januar": "January", "februar": "February", "mars": "March", "april": "April",
+    "mai": "May", "juni": "June", "juli": "July", "august": "August",
+    "september": "September", "oktober": "October", "november": "November", "desember": "December",
+}
+
+
+def legacy_parse_no_date_to_iso(s):
+    """Referanse: den opprinnelige datokonverteringen (re.sub per måned + strptime)."""
+    if not s:
+        return ""
+    raw = s.strip()
+    for no, en in LEGACY_MONTHS.items():
+        raw = re.sub(no, en, raw, flags=re.IGNORECASE)
+    try:
+        dt = datetime.strptime(raw.replace("  ", " "), "%d. %B %Y")
+        return dt.date().isoformat()
+    except Exception:
+        return ""
+
+
+def legacy_extract(html):
+    """Referanse: slik scrape_one parset før (full soup + get_text)."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "lxml")
+    text = soup.get_text(" ", strip=True)
+    m_brudd = su.BRUDD_RE.search(text)
+    m_upd = su.SIST_OPPDATERT_RE.search(text)
+    m_created = su.OPPRETTET_RE.search(text)
+    codes = set()
+    for a in soup.find_all("a", href=True):
+        m = re.search(r"/wcag/([1-4]\.\d{1,2}\.\d{1,2})(?:\D|$)", a["href"])
+        if m:
+            codes.add(m.group(1))
+    if not codes:
+        codes = set(su.WCAG_CODE_RE.findall(text))
+    return {
+        "brudd": m_brudd.group(1) if m_brudd else "",
+        "krav": m_brudd.group(2) if m_brudd else "",
+        "updated": legacy_parse_no_date_to_iso(m_upd.group(1)) if m_upd else "",
+        "created": legacy_parse_no_date_to_iso(m_created.group(1)) if m_created else "",
+        "codes": sorted(codes),
+    }
+
+
+def bench(fn, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _, html in pages:
+            fn(html)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(pages) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("paths", nargs="*", default=[str(uu_fetch.CACHE_DIR)])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--no-legacy", action="store_true", help="hopp over BeautifulSoup-referansen")
+    ap.add_argument("--check", action="store_true", help="kjør bare regresjonssjekken for tomme sider")
+    args = ap.parse_args()
+
+    errors = check_empty_bodies()
+    for e in errors:
+        print(f"  FEIL (tom side): {e}", file=sys.stderr)
+    if args.check:
+        print(f"Tomme sider: {len(EMPTY_BODIES) - len(errors)} av {len(EMPTY_BODIES)} ok")
+        sys.exit(1 if errors else 0)
+
+    pages = load_pages(args.paths)
+    if not pages:
+        print(f"Fant ingen sider i {args.paths}", file=sys.stderr)
+        sys.exit(1)
+
+    size_kb = sum(len(h) for _, h in pages) / len(pages) / 1024
+    print(f"{len(pages)} sider, snitt {size_kb:.1f} KB, beste av {args.repeat} runder")
+
+    new_ms = bench(su.extract_fields, pages, args.repeat)
+    print(f"  extract_fields : {new_ms:8.3f} ms/side")
+
+    if not args.no_legacy:
+        old_ms = bench(legacy_extract, pages, args.repeat)
+        print(f"  legacy (bs4)   : {old_ms:8.3f} ms/side  ({old_ms / new_ms:.1f}x)")
+        diff = [name for name, html in pages if su.extract_fields(html) != legacy_extract(html)]
+        if diff:
+            print(f"  ADVARSEL: ulikt resultat for {len(diff)} sider, f.eks. {diff[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,9 @@ import os
 from pathlib import Path
 from urllib.parse import urlparse, urlunparse
 from collections import defaultdict
+from functools import lru_cache
+
+import static_out
 
 # --- konfig ---
 DOCS = Path("docs")
@@ -17,8 +20,18 @@ SOURCE_CSV  = DOCS / "uu-status.csv"            # fallback hvis JSON mangler
 DATA_DIR    = DOCS / "data" / "uustatus"
 LOGS_DIR    = DATA_DIR / "logs"
 LATEST_JSON = DATA_DIR / "latest.json"          # forrige baseline for diff
-CHANGES_LOG = LOGS_DIR / "changes.jsonl"
+LATEST_FPS  = DATA_DIR / "latest.fingerprints.json"  # make_key -> fingerprint for baseline
+CHANGES_LOG = LOGS_DIR / "changes.jsonl"           # gammel append-only logg (migreres til segmenter)
+CHANGES_DIR = LOGS_DIR / "changes"                 # segmenter: changes-YYYY-MM[.N].jsonl
+CHANGES_MANIFEST = LOGS_DIR / "changes-manifest.json"  # segmentliste (dato-spenn, antall, bytes)
+CHANGES_INDEX = LOGS_DIR / "changes-index.json"        # URL-/domene-offsets inn i segmentene
+SEGMENT_MAX_BYTES = int(os.getenv("CHANGES_SEGMENT_MAX_BYTES", str(4 * 1024 * 1024)))
+HISTORY_DIR = DATA_DIR / "history"                 # tidsreise: keyframes/ + deltas/ + manifest.json
+KEYFRAME_EVERY = max(1, int(os.getenv("HISTORY_KEYFRAME_EVERY", "30")))  # maks deltaer mellom keyframes
 SNAP_BY_UPDATED = DATA_DIR / "snapshots_by_updated"
+ROLLUPS_JSON = DATA_DIR / "rollups.json"           # forhåndsberegnede trender for sidene
+# Kjøringer som beholdes i rollups.json (uu-status.html viser de siste 90 i trenddiagrammet)
+ROLLUP_DAYS = max(1, int(os.getenv("UU_ROLLUP_DAYS", "90")))
 
 # ---------- util ----------
 def today_str():
@@ -46,6 +59,7 @@ def to_domain(url: str):
     except Exception:
         return ""
 
+@lru_cache(maxsize=65536)
 def canon_url(u: str) -> str:
     """Normaliser URL for stabil matching."""
     try:
@@ -123,6 +137,110 @@ def _extract_codes(raw: dict):
 
     return []
 
+# ---------- WCAG-bitsett ----------
+# Fast ordbok: suksesskriterium -> bitposisjon (= indeks). KUN legg til på slutten,
+# posisjonene er lagret på disk (ncMask i latest.json).
+WCAG_SC = [
+    "1.1.1",
+    "1.2.1", "1.2.2", "1.2.3", "1.2.4", "1.2.5", "1.2.6", "1.2.7", "1.2.8", "1.2.9",
+    "1.3.1", "1.3.2", "1.3.3", "1.3.4", "1.3.5", "1.3.6",
+    "1.4.1", "1.4.2", "1.4.3", "1.4.4", "1.4.5", "1.4.6", "1.4.7", "1.4.8", "1.4.9",
+    "1.4.10", "1.4.11", "1.4.12", "1.4.13",
+    "2.1.1", "2.1.2", "2.1.3", "2.1.4",
+    "2.2.1", "2.2.2", "2.2.3", "2.2.4", "2.2.5", "2.2.6",
+    "2.3.1", "2.3.2", "2.3.3",
+    "2.4.1", "2.4.2", "2.4.3", "2.4.4", "2.4.5", "2.4.6", "2.4.7", "2.4.8", "2.4.9",
+    "2.4.10", "2.4.11", "2.4.12", "2.4.13",
+    "2.5.1", "2.5.2", "2.5.3", "2.5.4", "2.5.5", "2.5.6", "2.5.7", "2.5.8",
+    "3.1.1", "3.1.2", "3.1.3", "3.1.4", "3.1.5", "3.1.6",
+    "3.2.1", "3.2.2", "3.2.3", "3.2.4", "3.2.5", "3.2.6",
+    "3.3.1", "3.3.2", "3.3.3", "3.3.4", "3.3.5", "3.3.6", "3.3.7", "3.3.8", "3.3.9",
+    "4.1.1", "4.1.2", "4.1.3",
+]
+WCAG_BIT = {code: i for i, code in enumerate(WCAG_SC)}
+
+def codes_to_bits(codes):
+    """Liste med koder -> (bitmaske, frozenset med koder utenfor ordboka)."""
+    mask, extra = 0, []
+    for c in codes:
+        bit = WCAG_BIT.get(c)
+        if bit is None:
+            extra.append(c)
+        else:
+            mask |= 1 << bit
+    return mask, frozenset(extra)
+
+def mask_to_codes(mask: int):
+    out = []
+    while mask:
+        low = mask & -mask
+        out.append(WCAG_SC[low.bit_length() - 1])
+        mask ^= low
+    return out
+
+def bits_to_codes(mask: int, extra=()):
+    """JSON-visningen: sortert liste med koder (samme rekkefølge som før)."""
+    return sorted(mask_to_codes(mask) + list(extra))
+
+def count_bits(bits):
+    mask, extra = bits
+    return mask.bit_count() + len(extra)
+
+class Entry(dict):
+    """Normalisert entry. Serialiseres som vanlig dict (nonConformities som liste).
+    `fp` er sha1 av innholdet, beregnet én gang (samme verdi som before_hash/after_hash
+    i endringsloggen); `nc` er (bitmaske, ekstra koder) for nonConformities."""
+    __slots__ = ("fp", "nc")
+
+def nc_bits(it: dict):
+    bits = getattr(it, "nc", None)
+    if bits is None:
+        bits = codes_to_bits(it.get("nonConformities") or [])
+        if isinstance(it, Entry):
+            it.nc = bits
+    return bits
+
+def encode_entry(e: dict) -> dict:
+    """Kompakt diskformat for latest.json: nonConformities -> ncMask (hex) [+ ncExtra]."""
+    out = {}
+    for k, v in e.items():
+        if k == "nonConformities":
+            mask, extra = nc_bits(e)
+            out["ncMask"] = format(mask, "x")
+            if extra:
+                out["ncExtra"] = sorted(extra)
+        else:
+            out[k] = v
+    return out
+
+def decode_entry(raw):
+    """Motsatt av encode_entry. Rader i gammelt format (liste) returneres uendret."""
+    if not isinstance(raw, dict) or "ncMask" not in raw:
+        return raw
+    out = {}
+    for k, v in raw.items():
+        if k == "ncMask":
+            out["nonConformities"] = bits_to_codes(int(v or "0", 16), raw.get("ncExtra") or ())
+        elif k != "ncExtra":
+            out[k] = v
+    return out
+
+def fingerprint(it: dict) -> str:
+    fp = getattr(it, "fp", None)
+    return fp if fp is not None else sha1(it)
+
+def with_fingerprints(rows, fps=None):
+    """Gi baseline-rader fingerprint: fra latest.fingerprints.json hvis mulig, ellers sha1 én gang."""
+    fps = fps or {}
+    out = []
+    for it in rows:
+        if isinstance(it, dict):
+            e = Entry(it)
+            e.fp = fps.get(make_key(it)) or sha1(it)
+            it = e
+        out.append(it)
+    return out
+
 def normalize_entry(raw: dict):
     url = (raw.get("url") or raw.get("href") or "").strip()
     domain = (raw.get("domain") or to_domain(url)).strip()
@@ -134,14 +252,16 @@ def normalize_entry(raw: dict):
     if total is None:
         total = len(codes)
 
-    return {
+    e = Entry({
         "url": url,
         "domain": domain,
         "title": title,
         "updatedAt": updatedAt,
         "nonConformities": sorted(codes),
         "totalNonConformities": int(total),
-    }
+    })
+    e.fp = sha1(e)
+    return e
 
 def sha1(obj):
     return hashlib.sha1(json.dumps(obj, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
@@ -176,26 +296,87 @@ def read_current():
     rows = load_csv(SOURCE_CSV)
     return [normalize_entry(x) for x in rows]
 
-def read_prev_from_ref(ref: str):
-    """Les baseline latest.json fra gitt git-ref.
-       Ved feil/mangel -> TOM baseline ([]) for å trigge 'første gangs' endringer.
-    """
+class GitBatchReader:
+    """Én langlivet `git cat-file --batch`-prosess for å lese latest.json fra mange refs."""
+
+    def __init__(self):
+        try:
+            self.proc = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            )
+        except Exception:
+            self.proc = None
+
+    def read(self, spec: str):
+        """-> (blob_id, bytes). (None, None) hvis objektet mangler eller git feiler."""
+        if self.proc is None or self.proc.poll() is not None:
+            return None, None
+        try:
+            self.proc.stdin.write(spec.encode("utf-8") + b"\n")
+            self.proc.stdin.flush()
+            header = self.proc.stdout.readline().decode("utf-8", "replace").split()
+            if len(header) != 3:
+                return None, None  # "<spec> missing" / "ambiguous"
+            blob_id, _, size = header
+            data = self.proc.stdout.read(int(size))
+            self.proc.stdout.read(1)  # avsluttende LF
+            return blob_id, data
+        except Exception:
+            return None, None
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except Exception:
+                self.proc.kill()
+
+def parse_baseline(blob):
+    """Bytes fra latest.json -> liste med entries ([] ved feil)."""
     try:
-        blob = subprocess.check_output(["git", "show", f"{ref}:{LATEST_JSON.as_posix()}"], text=True)
         js = json.loads(blob)
         urls = js.get("urls") if isinstance(js, dict) else js
         return urls if isinstance(urls, list) else []
     except Exception:
-        return []  # <- viktig
+        return []
+
+def parse_fingerprints(blob):
+    try:
+        fps = json.loads(blob)
+        return fps if isinstance(fps, dict) else {}
+    except Exception:
+        return {}
+
+def read_prev_from_ref(ref: str, reader: GitBatchReader, cache: dict):
+    """Les baseline latest.json fra gitt git-ref -> (blob_id, rows, index).
+       Parsede/indekserte baselines caches på blob-id, så like blobs parses én gang.
+       Ved feil/mangel -> TOM baseline ([]) for å trigge 'første gangs' endringer.
+    """
+    blob_id, blob = reader.read(f"{ref}:{LATEST_JSON.as_posix()}")
+    if blob_id is None:
+        blob_id = "(mangler)"  # alle manglende refs gir samme tomme baseline
+    if blob_id not in cache:
+        rows = [decode_entry(x) for x in parse_baseline(blob)] if blob is not None else []  # <- viktig
+        fps = {}
+        if rows:
+            _, fp_blob = reader.read(f"{ref}:{LATEST_FPS.as_posix()}")
+            if fp_blob is not None:
+                fps = parse_fingerprints(fp_blob)
+        rows = with_fingerprints(rows, fps)
+        cache[blob_id] = (rows, index_by_key(rows))
+    rows, index = cache[blob_id]
+    return blob_id, rows, index
 
 # --------- diff ----------
 CHECK_FIELDS = ["title", "status", "updatedAt", "totalNonConformities"]
 
 def compute_change(prev_entry: dict, curr_entry: dict):
-    p_nc = set(prev_entry.get("nonConformities") or [])
-    c_nc = set(curr_entry.get("nonConformities") or [])
-    added = sorted(list(c_nc - p_nc))
-    removed = sorted(list(p_nc - c_nc))
+    p_bits, c_bits = nc_bits(prev_entry), nc_bits(curr_entry)
+    flipped = p_bits[0] ^ c_bits[0]
+    added = bits_to_codes(c_bits[0] & flipped, c_bits[1] - p_bits[1])
+    removed = bits_to_codes(p_bits[0] & flipped, p_bits[1] - c_bits[1])
 
     changed = {}
     for f in CHECK_FIELDS:
@@ -203,8 +384,9 @@ def compute_change(prev_entry: dict, curr_entry: dict):
             changed[f] = {"before": prev_entry.get(f), "after": curr_entry.get(f)}
 
     if added or removed:
-        if "totalNonConformities" not in changed and len(p_nc) != len(c_nc):
-            changed["totalNonConformities"] = {"before": len(p_nc), "after": len(c_nc)}
+        p_n, c_n = count_bits(p_bits), count_bits(c_bits)
+        if "totalNonConformities" not in changed and p_n != c_n:
+            changed["totalNonConformities"] = {"before": p_n, "after": c_n}
 
     if changed or added or removed:
         return (changed or None, added, removed)
@@ -224,7 +406,7 @@ def make_initial_changes(curr_rows):
             "url": c.get("url") or "",
             "domain": c.get("domain") or to_domain(c.get("url") or ""),
             "before_hash": None,
-            "after_hash": sha1(c),
+            "after_hash": fingerprint(c),
             "added": c.get("nonConformities") or [],
             "removed": [],
             "changed": {
@@ -235,9 +417,11 @@ def make_initial_changes(curr_rows):
         })
     return out
 
-def diff_once(prev_rows, curr_rows):
-    prev_by = index_by_key(prev_rows or [])
-    curr_by = index_by_key(curr_rows or [])
+def diff_once(prev_rows, curr_rows, prev_by=None, curr_by=None):
+    if prev_by is None:
+        prev_by = index_by_key(prev_rows or [])
+    if curr_by is None:
+        curr_by = index_by_key(curr_rows or [])
 
     # DEBUG: tell keys
     print(f"  prev_rows={len(prev_rows or [])} | prev_keys={len(prev_by)}  ||  curr_rows={len(curr_rows or [])} | curr_keys={len(curr_by)}")
@@ -263,7 +447,7 @@ def diff_once(prev_rows, curr_rows):
                 "url": c.get("url") or "",
                 "domain": c.get("domain") or to_domain(c.get("url") or ""),
                 "before_hash": None,
-                "after_hash": sha1(c),
+                "after_hash": fingerprint(c),
                 "added": c.get("nonConformities") or [],
                 "removed": [],
                 "changed": {
@@ -273,6 +457,9 @@ def diff_once(prev_rows, curr_rows):
                 "updatedDate": updated_date
             })
         else:
+            p_fp, c_fp = fingerprint(p), fingerprint(c)
+            if p_fp == c_fp:
+                continue  # uendret: ingen felt-/sett-sammenligning
             changed, added, removed = compute_change(p, c)
             if changed or added or removed:
                 updated_date = (c.get("updatedAt") or "")[:10] or today_str()
@@ -281,8 +468,8 @@ def diff_once(prev_rows, curr_rows):
                     "detectedDate": detected_date,
                     "url": c.get("url") or "",
                     "domain": c.get("domain") or to_domain(c.get("url") or ""),
-                    "before_hash": sha1(dict(p)),
-                    "after_hash": sha1(dict(c)),
+                    "before_hash": p_fp,
+                    "after_hash": c_fp,
                     "added": added,
                     "removed": removed,
                     "changed": changed,
@@ -293,27 +480,434 @@ def diff_once(prev_rows, curr_rows):
     for k, p in prev_by.items():
         if k in curr_by:
             continue
-        p_nc = set(p.get("nonConformities") or [])
-        removed = sorted(list(p_nc))
+        p_bits = nc_bits(p)
+        removed = bits_to_codes(*p_bits)
         updated_date = (p.get("updatedAt") or "")[:10] or today_str()
         changes.append({
             "ts": now_iso,
             "detectedDate": detected_date,
             "url": p.get("url") or "",
             "domain": p.get("domain") or to_domain(p.get("url") or ""),
-            "before_hash": sha1(dict(p)),
+            "before_hash": fingerprint(p),
             "after_hash": None,
             "added": [],
             "removed": removed,
             "changed": {
                 "removedEntry": True,
-                "totalNonConformities": {"before": len(p_nc), "after": 0}
+                "totalNonConformities": {"before": count_bits(p_bits), "after": 0}
             },
             "updatedDate": updated_date
         })
 
     return changes
 
+# --------- segmentert endringslogg ----------
+# Manifest: {"segments": [{"file", "month", "part", "from", "to", "count", "bytes"}], "index": ...}
+# Indeks:   {"urls": {canon_url: [[seg, offset, length], ...]},
+#            "domains": {domain: [[seg, start, end], ...]},  (ett byte-spenn per segment)
+#            "bytes": [dekket lengde per segment]}
+# Manifestet er eneste commit-punkt: det skrives først, og indeksen er avledet av
+# segmentene. Krasjer en kjøring mellom de to, ligger indeksen bak manifestet og
+# tas igjen ved neste lesing (se _catch_up_index); den peker aldri forbi det.
+def _index_row(index, si, off, n, row):
+    url = (row.get("url") or "").strip()
+    if url:
+        index["urls"].setdefault(canon_url(url), []).append([si, off, n])
+    domain = (row.get("domain") or "").strip().lower()
+    if domain:
+        spans = index["domains"].setdefault(domain, [])
+        if spans and spans[-1][0] == si:
+            spans[-1][2] = off + n
+        else:
+            spans.append([si, off, off + n])
+
+def _catch_up_index(manifest, index):
+    """Indekser det manifestet har committet, men indeksen ikke dekker. -> antall rader."""
+    segments = manifest["segments"]
+    if "bytes" not in index:   # eldre indeks uten dekningsinfo: bygg helt på nytt
+        index.update(urls={}, domains={}, bytes=[])
+    covered = index["bytes"]
+    covered += [0] * (len(segments) - len(covered))
+    added = 0
+    for si, seg in enumerate(segments):
+        if covered[si] >= seg["bytes"]:
+            continue
+        with (LOGS_DIR / seg["file"]).open("rb") as f:
+            f.seek(covered[si])
+            off = covered[si]
+            for line in f.read(seg["bytes"] - covered[si]).splitlines(keepends=True):
+                if line.strip():
+                    _index_row(index, si, off, len(line), json.loads(line))
+                    added += 1
+                off += len(line)
+        covered[si] = seg["bytes"]
+    return added
+
+def load_changelog():
+    manifest = load_json(CHANGES_MANIFEST, fallback=None) or {}
+    index = load_json(CHANGES_INDEX, fallback=None) or {}
+    manifest.setdefault("segments", [])
+    index.setdefault("urls", {})
+    index.setdefault("domains", {})
+    _catch_up_index(manifest, index)
+    return manifest, index
+
+def _segment_for(segments, month: str) -> int:
+    """Indeks til siste segment for måneden hvis det har plass, ellers et nytt segment."""
+    part = 1
+    for i in range(len(segments) - 1, -1, -1):
+        if segments[i]["month"] == month:
+            if segments[i]["bytes"] < SEGMENT_MAX_BYTES:
+                return i
+            part = segments[i]["part"] + 1
+            break
+    name = f"changes-{month}.jsonl" if part == 1 else f"changes-{month}.{part}.jsonl"
+    segments.append({"file": f"changes/{name}", "month": month, "part": part,
+                     "from": None, "to": None, "count": 0, "bytes": 0})
+    return len(segments) - 1
+
+def append_changes(rows):
+    """Legg endringer til i månedssegmenter og oppdater manifest + indeks."""
+    rows = list(rows)
+    if not rows:
+        return
+    manifest, index = load_changelog()
+    segments = manifest["segments"]
+    CHANGES_DIR.mkdir(parents=True, exist_ok=True)
+    handles = {}
+    try:
+        for row in rows:
+            day = (row.get("detectedDate") or (row.get("ts") or "")[:10] or today_str())
+            si = _segment_for(segments, day[:7])
+            seg = segments[si]
+            fh = handles.get(si)
+            if fh is None:
+                fh = handles[si] = (LOGS_DIR / seg["file"]).open("ab")
+                # alt etter manifestets lengde er fra en kjøring som krasjet før manifestet ble skrevet
+                if fh.seek(0, os.SEEK_END) > seg["bytes"]:
+                    fh.truncate(seg["bytes"])
+                seg["bytes"] = fh.seek(0, os.SEEK_END)
+            data = (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")
+            off = seg["bytes"]
+            fh.write(data)
+            seg["bytes"] += len(data)
+            seg["count"] += 1
+            seg["from"] = min(seg["from"] or day, day)
+            seg["to"] = max(seg["to"] or day, day)
+
+            _index_row(index, si, off, len(data), row)
+    finally:
+        for fh in handles.values():
+            fh.close()
+
+    manifest["index"] = CHANGES_INDEX.name
+    manifest["count"] = sum(seg["count"] for seg in segments)
+    index["bytes"] = [seg["bytes"] for seg in segments]
+    static_out.write_json(CHANGES_MANIFEST, manifest)   # commit-punktet for det som er lagt til
+    static_out.write_json(CHANGES_INDEX, index)         # avledet; tas igjen hvis vi krasjer her
+
+def migrate_legacy_log():
+    """Flytt gammel changes.jsonl inn i segmentene (én gang) og fjern den."""
+    if CHANGES_MANIFEST.exists() or not CHANGES_LOG.exists():
+        return
+    rows = []
+    with CHANGES_LOG.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    rows.append(json.loads(line))
+                except Exception:
+                    pass
+    append_changes(rows)
+    CHANGES_LOG.unlink()
+    print(f"Migrerte {len(rows)} endringer fra {CHANGES_LOG} til {CHANGES_DIR}")
+
+def changes_for(target: str, since: str | None = None, until: str | None = None):
+    """Endringer for en URL eller et domene, i loggrekkefølge.
+
+    Slår opp i indeksen og leser kun de byte-spennene som trengs; segmenter
+    utenfor [since, until] (YYYY-MM-DD, inklusive, på detectedDate) hoppes over.
+    """
+    manifest, index = load_changelog()
+    segments = manifest["segments"]
+    target = (target or "").strip()
+    if "://" in target:
+        key = canon_url(target)
+        spans = [(si, off, off + n) for si, off, n in index["urls"].get(key, [])]
+        match = lambda row: canon_url(row.get("url") or "") == key
+    else:
+        key = target.lower()
+        spans = [tuple(x) for x in index["domains"].get(key, [])]
+        match = lambda row: (row.get("domain") or "").strip().lower() == key
+
+    by_seg = defaultdict(list)
+    for si, start, end in spans:
+        seg = segments[si]
+        if (since and seg["to"] < since) or (until and seg["from"] > until):
+            continue
+        by_seg[si].append((start, end))
+
+    out = []
+    for si in sorted(by_seg):
+        with (LOGS_DIR / segments[si]["file"]).open("rb") as f:
+            for start, end in by_seg[si]:
+                f.seek(start)
+                for line in f.read(end - start).splitlines():
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    day = row.get("detectedDate") or (row.get("ts") or "")[:10]
+                    if since and day < since:
+                        continue
+                    if until and day > until:
+                        continue
+                    if match(row):
+                        out.append(row)
+    return out
+
+# --------- tidsreise (keyframes + deltaer) ----------
+# manifest.json: {"keyframes": [dato, ...], "deltas": [dato, ...]} (sortert)
+# keyframes/<dato>.json: {"date", "urls": [entries]}          (kompakt, som latest.json)
+# deltas/<dato>.json:    {"date", "upsert": [entries], "remove": [keys]}
+# head.json:             make_key -> fingerprint for siste lagrede tilstand
+def _history_manifest():
+    m = load_json(HISTORY_DIR / "manifest.json", fallback=None) or {}
+    m.setdefault("keyframes", [])
+    m.setdefault("deltas", [])
+    return m
+
+def _write_history(name: str, obj):
+    static_out.write_json(HISTORY_DIR / name, obj)
+
+def record_history(curr_by: dict, date_key: str | None = None):
+    """Lagre dagens tilstand: full keyframe med jevne mellomrom, ellers en delta
+    mot forrige lagrede tilstand (sammenlignet på fingerprint, ikke felt for felt)."""
+    date_key = date_key or today_str()
+    m = _history_manifest()
+    head = load_json(HISTORY_DIR / "head.json", fallback=None)
+    last_kf = m["keyframes"][-1] if m["keyframes"] else None
+    since_kf = [d for d in m["deltas"] if last_kf and d > last_kf]
+    new_head = {k: fingerprint(e) for k, e in curr_by.items()}
+
+    if head is None or last_kf is None or last_kf == date_key or (
+            len(since_kf) >= KEYFRAME_EVERY and date_key not in since_kf):
+        _write_history(f"keyframes/{date_key}.json",
+                       {"date": date_key, "urls": [encode_entry(e) for e in curr_by.values()]})
+        if date_key not in m["keyframes"]:
+            m["keyframes"].append(date_key)
+        kind = "keyframe"
+    else:
+        delta = load_json(HISTORY_DIR / f"deltas/{date_key}.json", fallback=None) \
+            or {"date": date_key, "upsert": [], "remove": []}
+        upsert = {make_key(x): x for x in delta["upsert"]}
+        remove = set(delta["remove"])
+        for k, e in curr_by.items():
+            if head.get(k) != new_head[k]:
+                upsert[k] = encode_entry(e)
+                remove.discard(k)
+        for k in head:
+            if k not in curr_by:
+                upsert.pop(k, None)
+                remove.add(k)
+        delta["upsert"], delta["remove"] = list(upsert.values()), sorted(remove)
+        _write_history(f"deltas/{date_key}.json", delta)
+        if date_key not in m["deltas"]:
+            m["deltas"].append(date_key)
+        kind = f"delta (+{len(upsert)} / -{len(remove)})"
+
+    m["keyframes"].sort()
+    m["deltas"].sort()
+    _write_history("head.json", new_head)
+    _write_history("manifest.json", m)
+    print(f"Historikk {date_key}: {kind}")
+
+def as_of(date: str):
+    """Hele det normaliserte datasettet slik det så ut ved slutten av `date` (YYYY-MM-DD).
+
+    Laster nærmeste keyframe <= date og legger på maks KEYFRAME_EVERY deltaer,
+    så kostnaden er uavhengig av hvor lang historikken er. [] før første keyframe.
+    """
+    m = _history_manifest()
+    kfs = [d for d in m["keyframes"] if d <= date]
+    if not kfs:
+        return []
+    kf = kfs[-1]
+    snap = load_json(HISTORY_DIR / f"keyframes/{kf}.json", fallback={}) or {}
+    state = {}
+    for raw in snap.get("urls", []):
+        e = decode_entry(raw)
+        k = make_key(e)
+        if k:
+            state[k] = e
+    for d in m["deltas"]:
+        if kf < d <= date:
+            delta = load_json(HISTORY_DIR / f"deltas/{d}.json", fallback={}) or {}
+            for k in delta.get("remove", []):
+                state.pop(k, None)
+            for raw in delta.get("upsert", []):
+                e = decode_entry(raw)
+                k = make_key(e)
+                if k:
+                    state[k] = e
+    return list(state.values())
+
+# --------- trend-rollups ----------
+# rollups.json:
+#   state:    sha1 av (nøkkel, fingerprint) for tilstanden rollupene gjelder
+#   current:  {entries, violations, zero, byDomain: {dom: [entries, violations]}, byCode: {kode: antall}}
+#   days:     {dato: {new, removed, improved, worsened, changed, entries, violations, zero}}
+#   domains:  {dom: [[dato, violations], ...]}   (nytt punkt kun når verdien endres)
+#   criteria: {kode: [[dato, antall], ...]}
+# Alle tre holdes innenfor de siste ROLLUP_DAYS kjøringene (se _trim_rollups).
+def _state_fp(by: dict) -> str:
+    return sha1(sorted([k, fingerprint(e)] for k, e in by.items()))
+
+def _rollup_add(cur: dict, e: dict, sign: int, touched_dom: set, touched_codes: set):
+    dom = e.get("domain") or to_domain(e.get("url") or "")
+    n = int(e.get("totalNonConformities") or 0)
+    cur["entries"] += sign
+    cur["violations"] += sign * n
+    if n == 0:
+        cur["zero"] += sign
+    d = cur["byDomain"].setdefault(dom, [0, 0])
+    d[0] += sign
+    d[1] += sign * n
+    if d[0] <= 0:
+        del cur["byDomain"][dom]
+    touched_dom.add(dom)
+    for code in bits_to_codes(*nc_bits(e)):
+        cur["byCode"][code] = cur["byCode"].get(code, 0) + sign
+        if cur["byCode"][code] <= 0:
+            del cur["byCode"][code]
+        touched_codes.add(code)
+
+def _series_set(series: list, date_key: str, value: int):
+    """Sett dagens punkt; tidsserien lagrer bare endringspunkter."""
+    if series and series[-1][0] == date_key:
+        series.pop()
+    if not series or series[-1][1] != value:
+        series.append([date_key, value])
+
+def _trim_series(series: list, cutoff: str):
+    """Dropp punkter før `cutoff`, men behold det siste av dem (verdien som gjaldt da)."""
+    i = 0
+    while i + 1 < len(series) and series[i + 1][0] <= cutoff:
+        i += 1
+    del series[:i]
+
+def _trim_rollups(days: dict, domains: dict, criteria: dict):
+    """Behold de siste ROLLUP_DAYS kjøringene; tidsserier kuttes til samme vindu, og
+    domener/koder som har vært borte (verdi 0) i hele vinduet fjernes."""
+    for d in sorted(days)[:-ROLLUP_DAYS]:
+        del days[d]
+    if not days:
+        return
+    cutoff = min(days)
+    for table in (domains, criteria):
+        for key in list(table):
+            series = table[key]
+            _trim_series(series, cutoff)
+            if len(series) == 1 and series[0][0] <= cutoff and series[0][1] == 0:
+                del table[key]
+
+def _write_rollups(date_key: str, state: str, cur: dict, days: dict, domains: dict, criteria: dict):
+    _trim_rollups(days, domains, criteria)
+    out = {
+        "asOf": date_key,
+        "state": state,
+        "current": {**cur,
+                    "byDomain": dict(sorted(cur["byDomain"].items())),
+                    "byCode": dict(sorted(cur["byCode"].items(), key=lambda kv: (-kv[1], kv[0])))},
+        "days": dict(sorted(days.items())),
+        "domains": dict(sorted(domains.items())),
+        "criteria": dict(sorted(criteria.items())),
+    }
+    static_out.write_json(ROLLUPS_JSON, out, compress=True)   # hentes av begge UU-sidene
+
+def update_rollups(prev_by: dict, curr_by: dict, date_key: str | None = None):
+    """Brett kveldens endringer (prev_by -> curr_by) inn i rollups.json.
+
+    Bare endrede entries (ulik fingerprint) berøres, og bare deres domener/koder
+    får nye punkter i tidsseriene. Hvis rollupene ikke er laget fra prev_by
+    (mangler / ute av synk), bygges `current` på nytt fra dagens datasett;
+    historikken (days/domains/criteria) beholdes uansett.
+    """
+    date_key = date_key or today_str()
+    r = load_json(ROLLUPS_JSON, fallback=None) or {}
+    curr_state = _state_fp(curr_by)
+    if r.get("state") == curr_state and r.get("current"):
+        # ingen endring siden forrige kjøring (eller samme dag på nytt): kjøringen teller
+        # likevel i "siste N kjøringer", med null endringer
+        cur = r["current"]
+        days = r.get("days") or {}
+        if date_key in days:
+            print("Rollups: allerede oppdatert for dagens datasett")
+            return
+        days[date_key] = {"new": 0, "removed": 0, "improved": 0, "worsened": 0, "changed": 0,
+                          "entries": cur["entries"], "violations": cur["violations"], "zero": cur["zero"]}
+        _write_rollups(date_key, curr_state, cur, days, r.get("domains") or {}, r.get("criteria") or {})
+        print(f"Rollups {date_key}: ingen endringer")
+        return
+
+    counts = {"new": 0, "removed": 0, "improved": 0, "worsened": 0, "changed": 0}
+    pairs = []   # (før, etter) for endrede entries
+    for k, c in curr_by.items():
+        p = prev_by.get(k)
+        if p is None:
+            counts["new"] += 1
+            pairs.append((None, c))
+        elif fingerprint(p) != fingerprint(c):
+            counts["changed"] += 1
+            p_n = int(p.get("totalNonConformities") or 0)
+            c_n = int(c.get("totalNonConformities") or 0)
+            if c_n < p_n:
+                counts["improved"] += 1
+            elif c_n > p_n:
+                counts["worsened"] += 1
+            pairs.append((p, c))
+    for k, p in prev_by.items():
+        if k not in curr_by:
+            counts["removed"] += 1
+            pairs.append((p, None))
+
+    touched_dom, touched_codes = set(), set()
+    cur = r.get("current")
+    fold = bool(cur) and r.get("state") == _state_fp(prev_by)
+    if fold:
+        for p, c in pairs:
+            if p is not None:
+                _rollup_add(cur, p, -1, touched_dom, touched_codes)
+            if c is not None:
+                _rollup_add(cur, c, +1, touched_dom, touched_codes)
+    else:
+        touched_dom.update((cur or {}).get("byDomain", {}))
+        touched_codes.update((cur or {}).get("byCode", {}))
+        cur = {"entries": 0, "violations": 0, "zero": 0, "byDomain": {}, "byCode": {}}
+        for c in curr_by.values():
+            _rollup_add(cur, c, +1, touched_dom, touched_codes)
+
+    days = r.get("days") or {}
+    day = days.get(date_key) if fold else None
+    if day:
+        for f, n in counts.items():
+            day[f] = day.get(f, 0) + n
+    else:
+        day = dict(counts)
+    day.update(entries=cur["entries"], violations=cur["violations"], zero=cur["zero"])
+    days[date_key] = day
+
+    domains = r.get("domains") or {}
+    for dom in touched_dom:
+        _series_set(domains.setdefault(dom, []), date_key, cur["byDomain"].get(dom, [0, 0])[1])
+    criteria = r.get("criteria") or {}
+    for code in touched_codes:
+        _series_set(criteria.setdefault(code, []), date_key, cur["byCode"].get(code, 0))
+
+    _write_rollups(date_key, curr_state, cur, days, domains, criteria)
+    print(f"Rollups {date_key}: {'brettet inn' if fold else 'bygget på nytt'} "
+          f"(+{counts['new']} / -{counts['removed']} / {counts['improved']} bedre / {counts['worsened']} verre)")
+
 # ---------- main ----------
 def main():
     LOGS_DIR.mkdir(parents=True, exist_ok=True)
@@ -342,13 +936,29 @@ def main():
     used_ref = None
 
     # Prøv alle refs. diff_once() håndterer tom baseline/0 keys.
-    for ref in refs:
-        prev_rows = read_prev_from_ref(ref)  # alltid liste (kan være tom)
-        changes = diff_once(prev_rows, curr)
-        if changes:
-            used_ref = ref
-            final_changes = changes
-            break
+    # Refs som peker på en blob vi allerede har diffet mot hoppes over
+    # (samme baseline -> samme (tomme) resultat).
+    reader = GitBatchReader()
+    baselines = {}   # blob_id -> (rows, index)
+    tried = set()
+    curr_by = index_by_key(curr)
+    base_by = None   # første ref (forrige kjøring) -> grunnlag for rollups
+    try:
+        for ref in refs:
+            blob_id, prev_rows, prev_by = read_prev_from_ref(ref, reader, baselines)
+            if base_by is None:
+                base_by = prev_by
+            if blob_id in tried:
+                print(f"  {ref}: samme baseline som tidligere ({blob_id[:10]}), hopper over")
+                continue
+            tried.add(blob_id)
+            changes = diff_once(prev_rows, curr, prev_by=prev_by, curr_by=curr_by)
+            if changes:
+                used_ref = ref
+                final_changes = changes
+                break
+    finally:
+        reader.close()
 
     if not final_changes:
         # Siste forsvar: snapshot ALT
@@ -358,44 +968,48 @@ def main():
 
     print(f"Diff-baseline: {used_ref}  |  Endringer funnet: {len(final_changes)}")
 
-    # 1) Logg endringer
-    with CHANGES_LOG.open("a", encoding="utf-8") as f:
-        for row in final_changes:
-            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    # 1) Logg endringer (segmentert logg + indeks)
+    migrate_legacy_log()
+    append_changes(final_changes)
 
     # 2) Skriv snapshots per updatedDate
-    changed_by_date = defaultdict(list)
-    curr_index = index_by_key(curr)
+    # Oppslag via indekser: curr_by (kanonisk URL / title+domain) og rå URL (første treff),
+    # i stedet for lineært søk i curr per endring.
+    by_raw_url = {}
+    for it in curr:
+        by_raw_url.setdefault(it.get("url") or "", it)
+
+    changed_by_date = defaultdict(dict)   # dato -> make_key -> entry
     for ch in final_changes:
-        candidate = None
         url = (ch.get("url") or "").strip()
-        if url:
-            kk = "url::" + canon_url(url)
-            candidate = curr_index.get(kk)
+        candidate = curr_by.get("url::" + canon_url(url)) if url else None
         if not candidate:
-            # fallback: prøv direkte URL-match
-            for it in curr:
-                if (it.get("url") or "") == url:
-                    candidate = it
-                    break
+            # fallback: direkte URL-match
+            candidate = by_raw_url.get(url)
         if not candidate:
             continue
-        key = (ch.get("updatedDate") or today_str())
-        changed_by_date[key].append(candidate)
+        kk = make_key(candidate)
+        if kk:
+            changed_by_date[ch.get("updatedDate") or today_str()][kk] = candidate
 
+    # Én last/flett/skriv per datofil; urørte filer skrives ikke på nytt
     for date_key, entries in changed_by_date.items():
         out_fp = SNAP_BY_UPDATED / f"{date_key}.json"
         existing = load_json(out_fp, fallback={"urls": []})
         exist_by = index_by_key(existing.get("urls", []))
-        for e in entries:
-            kk = make_key(e)
-            if kk:
-                exist_by[kk] = e
-        out_fp.write_text(json.dumps({"urls": list(exist_by.values())}, ensure_ascii=False, indent=2), encoding="utf-8")
+        if all(exist_by.get(kk) == e for kk, e in entries.items()):
+            continue
+        exist_by.update(entries)
+        static_out.write_json(out_fp, {"urls": list(exist_by.values())})
         print(f"Skrev snapshot for {date_key}: {out_fp}")
 
-    # 3) Oppdater baseline (ALLTID etter diff)
-    LATEST_JSON.write_text(json.dumps({"urls": curr}, ensure_ascii=False, indent=2), encoding="utf-8")
+    # 3) Tidsreise-lager (keyframe eller delta for i dag)
+    record_history(curr_by)
+    update_rollups(base_by or {}, curr_by)
+
+    # 4) Oppdater baseline (ALLTID etter diff)
+    static_out.write_json(LATEST_FPS, {k: fingerprint(e) for k, e in curr_by.items()})
+    static_out.write_json(LATEST_JSON, {"urls": [encode_entry(e) for e in curr]})
     print(f"Oppdaterte {LATEST_JSON}")
 
 if __name__ == "__main__":
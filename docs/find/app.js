@@ -3,7 +3,6 @@
   const $ = (id) => document.getElementById(id);
 
   // --- utils ---
-  const norm = (s) => (s || "").toLowerCase();
   const words = (s) => (s || "").toLowerCase().match(/[a-zæøå0-9]+/g) || [];
   const debounce = (fn, ms = 200) => {
     let t;
@@ -14,68 +13,222 @@
   };
 
   // --- data ---
+  // Via artifacts.json: innholdshashet, forhåndskomprimert kopi som kan caches lenge.
+  // Faller tilbake til ./index.json hvis manifest eller komprimert variant ikke virker.
+  async function fetchArtifact(name) {
+    try {
+      const mres = await fetch("./artifacts.json", { cache: "no-cache" });
+      const entry = mres.ok ? (await mres.json())[name] : null;
+      const file = entry && (entry.br || entry.gz);
+      if (file) {
+        const res = await fetch("./" + file);
+        if (res.ok) return await res.json();
+      }
+    } catch (e) {
+      /* fall tilbake til vanlig fil */
+    }
+    const res = await fetch("./" + name, { cache: "no-store" });
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    return res.json();
+  }
+
   async function loadIndex() {
     try {
-      const res = await fetch("./index.json", { cache: "no-store" });
-      if (!res.ok) throw new Error(`HTTP ${res.status}`);
-      const idx = await res.json();
+      const idx = await fetchArtifact("index.json");
       console.log("Index loaded:", {
         components: idx.components?.length || 0,
         patterns: idx.patterns?.length || 0,
-        docs: idx.all_docs?.length || 0,
+        docs: idx.docs?.count || 0,
+        shards: Object.keys(idx.search?.terms || {}).length,
       });
+      idx.searcher = prepareSearch(idx);
       return idx;
     } catch (e) {
       console.error("Kunne ikke laste index.json:", e);
       $("results").innerHTML = `<p>Feil ved lasting av index.json: ${String(e)}</p>`;
-      return { components: [], patterns: [], all_docs: [], aliases: {} };
+      return { components: [], patterns: [], all_docs: [], searcher: null };
     }
   }
 
-  // --- scoring / matching ---
-  function scoreDoc(queryTokens, doc) {
-    // enkel token-baserte treff: 1 poeng per token-treff, +bonus for komponent/mønster
-    const set = new Set(doc.tokens || []);
-    let s = 0;
-    for (const t of queryTokens) if (set.has(t)) s += 1;
-    if (doc.type === "component") s += 2;
-    if (doc.type === "pattern") s += 1;
-    // litt bonus hvis exakte ord i navn
-    const name = norm(doc.name || doc.title || "");
-    if (queryTokens.some((t) => name.includes(t))) s += 1;
-    return s;
+  // --- søk ---
+  // index.json er bare et manifest; søkestrukturen ligger i shards under index/ (se
+  // scripts/python/search_index.py): stammer, sammensatte ord og aliaser er allerede
+  // lagt inn i postinglistene (BM25-vekter), så her slås bare ordformer opp. Shards og
+  // dokumentbiter hentes først når en spørring trenger dem. Rangerer likt som
+  // ShardedSearch.query() der.
+  function prepareSearch(idx) {
+    const s = idx.search;
+    if (!s?.terms) {
+      console.warn("index.json mangler søkestruktur (search)");
+      return null;
+    }
+    // Filene har innholdshash i navnet og endres aldri: hent hver én gang (løftet
+    // deles av samtidige spørringer). Feilet henting glemmes, så neste søk prøver igjen.
+    const files = new Map();
+    const load = (name) => {
+      if (!files.has(name)) {
+        const p = fetch("./" + name).then((res) => {
+          if (!res.ok) throw new Error(`HTTP ${res.status} for ${name}`);
+          return res.json();
+        });
+        p.catch(() => files.delete(name));
+        files.set(name, p);
+      }
+      return files.get(name);
+    };
+    return {
+      ...s,
+      load,
+      docs: idx.docs,
+      componentIds: new Set(idx.components || []),
+      patternIds: new Set(idx.patterns || []),
+      docIds: new Set(idx.all_docs || []),
+    };
   }
 
-  function buildAnswerPack(query, idx) {
-    const qTokens = words(query);
-    if (!qTokens.length) return null;
+  async function getDoc(s, id) {
+    const chunk = await s.load(s.docs.files[Math.floor(id / s.docs.chunkSize)]);
+    return chunk[id % s.docs.chunkSize];
+  }
+
+  // -> [prefiks, shard] for det lengste shard-prefikset av ordet
+  async function shardFor(s, word) {
+    for (let i = word.length; i >= 0; i--) {
+      const key = word.slice(0, i);
+      if (Object.hasOwn(s.terms, key)) return [key, await s.load(s.terms[key])];
+    }
+    throw new Error(`Fant ikke shard for «${word}»`);
+  }
+
+  async function postings(s, term) {
+    const [, sh] = await shardFor(s, term);
+    return (Object.hasOwn(sh.postings, term) && sh.postings[term]) || [];
+  }
 
-    // Kandidater
-    const compCand = (idx.components || [])
-      .map((d) => ({ doc: d, score: scoreDoc(qTokens, d) }))
-      .filter((x) => x.score > 0)
-      .sort((a, b) => b.score - a.score);
+  // Går `rest` ned i trien fra `node` (som står for `path`) -> [node, form, eksakt],
+  // eller null hvis ingen ordform starter slik. Løvnoder er bare termen.
+  function trieWalk(node, rest, path) {
+    while (rest) {
+      if (typeof node === "string") return null;
+      const edge = Object.keys(node).find((e) => e !== "$" && e !== "^" && e[0] === rest[0]);
+      if (edge === undefined) return null;
+      if (rest.startsWith(edge)) {
+        node = node[edge];
+        path += edge;
+        rest = rest.slice(edge.length);
+      } else if (edge.startsWith(rest)) {
+        return [node[edge], path + edge, false]; // prefikset slutter midt på kanten
+      } else {
+        return null;
+      }
+    }
+    return [node, path, true];
+  }
 
-    const pattCand = (idx.patterns || [])
-      .map((d) => ({ doc: d, score: scoreDoc(qTokens, d) }))
-      .filter((x) => x.score > 0)
-      .sort((a, b) => b.score - a.score);
+  // [[form, term], ...] under en trie-node, høyest df først
+  const nodeTop = (node, form) => (typeof node === "string" ? [[form, node]] : node["^"]);
 
+  // Trigrammer med mellomrom som kantmarkør (som grams() i search_index.py)
+  function grams(word) {
+    const w = ` ${word} `;
+    const out = new Set();
+    for (let i = 0; i < w.length - 2; i++) out.add(w.slice(i, i + 3));
+    return [...out].sort();
+  }
+
+  // Trigram-shard: første tegn utenom kantmarkøren (gram_key() i search_index.py)
+  const gramKey = (gram) => gram.trim()[0];
+
+  // Ordformer som ligner (Dice over trigrammer) -> [[term, likhet], ...]
+  async function fuzzy(s, word) {
+    const g = grams(word);
+    const keys = [...new Set(g.map(gramKey))].filter((c) => Object.hasOwn(s.grams, c));
+    const shards = new Map(await Promise.all(keys.map(async (c) => [c, await s.load(s.grams[c])])));
+    const shared = new Map(); // form -> [term, antall felles trigrammer]
+    for (const gram of g) {
+      const sh = shards.get(gramKey(gram));
+      if (!sh || !Object.hasOwn(sh.grams, gram)) continue;
+      for (const i of sh.grams[gram]) {
+        const [f, t] = sh.forms[i];
+        const hit = shared.get(f) || [t, 0];
+        hit[1]++;
+        shared.set(f, hit);
+      }
+    }
+    return [...shared]
+      .map(([f, [t, c]]) => [f, t, (2 * c) / (g.length + grams(f).length)])
+      .filter(([, , sim]) => sim >= s.fuzzy.min)
+      .sort((a, b) => b[2] - a[2] || (a[0] < b[0] ? -1 : a[0] > b[0] ? 1 : 0))
+      .slice(0, s.fuzzy.top)
+      .map(([, t, sim]) => [t, sim]);
+  }
+
+  // Termene et ord slår opp -> Map(term -> faktor): ordformen (eller skrivemåte uten
+  // æøå / stammen) gir 1; siste ord utvides med prefiks; ellers fuzzy ved skrivefeil.
+  async function expand(s, word, last) {
+    const [key, sh] = await shardFor(s, word);
+    const [node, form, exact] = trieWalk(sh.trie, word.slice(key.length), key) || [null, null, false];
+    const out = new Map();
+    let term;
+    if (node !== null && exact) term = typeof node === "string" ? node : node["$"];
+    if (term === undefined && Object.hasOwn(sh.variants, word)) term = sh.variants[word];
+    if (term !== undefined) out.set(term, 1);
+    if (last && node !== null) {
+      for (const [, t] of nodeTop(node, form)) if (!out.has(t)) out.set(t, s.prefixFactor);
+    }
+    if (!out.size && word.length >= s.fuzzy.minLen) {
+      for (const [t, sim] of await fuzzy(s, word)) out.set(t, Math.max(out.get(t) || 0, sim * s.fuzzy.factor));
+    }
+    return out;
+  }
+
+  // -> [[docId, skår], ...] sortert på skår synkende, så docId. Per ord teller beste treff.
+  async function search(s, query) {
+    const ws = [...new Set(words(query))];
+    const expanded = await Promise.all(ws.map((w, pos) => expand(s, w, pos === ws.length - 1)));
+    const lists = await Promise.all(expanded.map((terms) => Promise.all([...terms.keys()].map((t) => postings(s, t)))));
+    const scores = new Map();
+    expanded.forEach((terms, k) => {
+      const best = new Map();
+      [...terms.values()].forEach((factor, i) => {
+        const p = lists[k][i];
+        for (let j = 0; j < p.length; j += 2) {
+          const v = p[j + 1] * factor;
+          if (v > (best.get(p[j]) || 0)) best.set(p[j], v);
+        }
+      });
+      for (const [id, v] of best) scores.set(id, (scores.get(id) || 0) + v);
+    });
+    return [...scores].sort((a, b) => b[1] - a[1] || a[0] - b[0]);
+  }
+
+  // Så mange kandidater per liste hentes parallelt før duplikatsjekken
+  const PREFETCH = 16;
+
+  async function buildAnswerPack(query, idx) {
+    const s = idx.searcher;
+    if (!s || !words(query).length) return null;
+
+    // Én rangering, delt opp etter hvor dokumentet hører hjemme
+    const ranked = await search(s, query);
+    const pick = (set) => ranked.filter(([id]) => set.has(id)).map(([id]) => id);
+    const compCand = pick(s.componentIds);
+    const pattCand = pick(s.patternIds);
     // Relatert innhold fra all_docs (språk/god praksis/visuell identitet osv.)
-    const extraCand = (idx.all_docs || [])
-      .map((d) => ({ doc: d, score: scoreDoc(qTokens, d) }))
-      .filter((x) => x.score > 0)
-      .sort((a, b) => b.score - a.score);
+    const extraCand = pick(s.docIds);
+    // Dokumentbitene til de øverste kandidatene hentes samtidig; resten ved behov
+    await Promise.all([...compCand.slice(0, 1), ...pattCand.slice(0, PREFETCH), ...extraCand.slice(0, PREFETCH)].map((id) => getDoc(s, id)));
 
     // Ta første relevante komponent som hovedkort
-    const component = compCand[0]?.doc || null;
+    const component = compCand.length ? await getDoc(s, compCand[0]) : null;
 
     // Filtrer ekstra-liste slik at vi ikke dupliserer hovedkortet,
     // og vis bare forskjellige URL-er
     const seenUrls = new Set(component ? [component.url] : []);
-    const unique = (arr) => {
+    const unique = async (ids) => {
       const out = [];
-      for (const { doc } of arr) {
+      for (const id of ids) {
+        const doc = await getDoc(s, id);
         if (!doc?.url || seenUrls.has(doc.url)) continue;
         seenUrls.add(doc.url);
         out.push(doc);
@@ -84,11 +237,9 @@
       return out;
     };
 
-    return {
-      component,
-      patterns: unique(pattCand),
-      extras: unique(extraCand),
-    };
+    const patterns = await unique(pattCand);
+    const extras = await unique(extraCand);
+    return { component, patterns, extras };
   }
 
   // --- rendering ---
@@ -168,11 +319,19 @@
     const input = $("q");
     const go = $("go");
 
-    const run = () => {
+    // Shards hentes asynkront: vis bare svaret på den siste spørringen
+    let seq = 0;
+    const run = async () => {
       const q = input.value.trim();
+      const n = ++seq;
       console.log("RUN search:", q);
-      const pack = buildAnswerPack(q, idx);
-      renderAnswerPack(pack, q);
+      try {
+        const pack = await buildAnswerPack(q, idx);
+        if (n === seq) renderAnswerPack(pack, q);
+      } catch (e) {
+        console.error("Søket feilet:", e);
+        if (n === seq) $("results").innerHTML = `<p>Feil ved søk: ${esc(String(e))}</p>`;
+      }
     };
 
     // Interaksjoner
@@ -1,21 +1,38 @@
 #!/usr/bin/env python3
-import json, re, sys, time
+import argparse, hashlib, json, os, queue, re, sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import repeat
 from pathlib import Path
 from urllib.parse import urlparse
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 try:
-    import requests
-    from bs4 import BeautifulSoup
+    import lxml.html
+    from lxml import etree
+    import uu_fetch
+    import static_out
 except Exception as e:
-    print("Missing deps. Make sure beautifulsoup4 and requests are installed.", file=sys.stderr)
+    print("Missing deps. Make sure lxml and requests are installed.", file=sys.stderr)
     sys.exit(1)
 
 DETAILS_FP = Path("docs/uu-status-details.json")
+# Vannmerke for inkrementell kjøring: per URL signatur fra scrape-steget + forrige resultat
+STATE_FP = Path("docs/data/uustatus/enrich-state.json")
+MAX_AGE_DAYS = float(os.getenv("UU_ENRICH_MAX_AGE_DAYS", "7"))  # tving ny henting etter så mange dager
+
+# Pipeline: nedlasting (tråder) -> avgrenset kø -> parsing (prosesser)
+FETCH_CONCURRENCY = max(1, int(os.getenv("UU_CONCURRENCY", "8")))
+PARSE_WORKERS = int(os.getenv("UU_PARSE_WORKERS", str(os.cpu_count() or 1)))  # 0 = parse i hovedprosessen
+QUEUE_SIZE = max(1, int(os.getenv("UU_QUEUE_SIZE", "32")))
 
 WCAG_CODE_RE = re.compile(r"\b(?:[0-3]\.\d{1,2}\.\d{1,2}[a-z]?)\b", re.I)
 DATE_NO_RE = re.compile(r"(?:Sist\s+(?:endret|oppdatert)[^0-9]{0,20})(\d{1,2}\.\d{1,2}\.\d{4})", re.I)
 DATE_ISO_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
 
+# Kun Next.js-payloaden dekodes; synlig tekst som soup.get_text() (uten script/style/template)
+NEXT_DATA_XPATH = etree.XPath('//script[@id="__NEXT_DATA__"]/text()')
+TEXT_XPATH = etree.XPath("//text()[not(ancestor::script or ancestor::style or ancestor::template)]")
+TITLE_XPATH = etree.XPath("//title/text()")
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; UU-Status-Bot/1.0; +https://github.com/)",
     "Accept": "text/html,application/xhtml+xml,application/json;q=0.9,*/*;q=0.8",
@@ -42,80 +59,87 @@ def parse_date_no(s: str):
     except Exception:
         return None
 
-def extract_codes_from_json_obj(obj):
-    """Gå rekursivt gjennom et JSON-objekt og trekk ut WCAG-koder uansett felt/struktur."""
-    found = []
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            # vanlige feltnavn
-            if k.lower() in {"nonconformities","violations","wcag","wcagcodes","wcag_violations","wcag_nonconformities","issues","problems"}:
-                if isinstance(v, list):
-                    for it in v:
-                        if isinstance(it, str) and WCAG_CODE_RE.search(it):
-                            found.extend(WCAG_CODE_RE.findall(it))
-                        elif isinstance(it, dict):
-                            # typisk { code: "1.1.1", ... }
-                            for kk in ["code","wcag","criterion","id","wcagId","wcag_id"]:
-                                if isinstance(it.get(kk), str) and WCAG_CODE_RE.search(it[kk]):
-                                    found.append(WCAG_CODE_RE.search(it[kk]).group(0))
-                                    break
-                elif isinstance(v, str) and WCAG_CODE_RE.search(v):
-                    found.extend(WCAG_CODE_RE.findall(v))
-            # uansett nøkkel: skann strenger og dypere noder
+UPDATED_KEY_TAGS = ("updated", "modified", "lastchecked", "lastupdated")
+
+def walk_json(obj):
+    """Ett iterativt gjennomløp av et JSON-objekt -> (codes, updated, title).
+
+    - codes: alle WCAG-koder i alle strengverdier (uansett felt/struktur)
+    - updated: første ISO-dato i felt som updatedAt / lastUpdated / modified osv.
+    - title: første ikke-tomme "title"-felt
+    Rekkefølgen er dybde-først som i dokumentet. Eksplisitt stakk av iteratorer,
+    så dype Next.js-payloads treffer ikke rekursjonsgrensen. Når dato og tittel
+    er funnet, sjekkes ikke feltnavn lenger.
+    """
+    codes = set()
+    updated = title = None
+    need_keys = True
+    stack = [iter(((None, obj),))]
+    while stack:
+        for k, v in stack[-1]:
             if isinstance(v, str):
-                found.extend(WCAG_CODE_RE.findall(v))
-            elif isinstance(v, (list, dict)):
-                found.extend(extract_codes_from_json_obj(v))
-    elif isinstance(obj, list):
-        for it in obj:
-            found.extend(extract_codes_from_json_obj(it))
-    elif isinstance(obj, str):
-        found.extend(WCAG_CODE_RE.findall(obj))
-    return found
-
-def extract_updated_from_json_obj(obj):
-    """Prøv å finne en ISO-dato i felt som heter updatedAt / lastUpdated / modified osv."""
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            lk = k.lower()
-            if isinstance(v, str) and any(tag in lk for tag in ["updated", "modified", "lastchecked", "lastupdated"]):
-                m = DATE_ISO_RE.search(v)
-                if m:
-                    return m.group(0)
-            elif isinstance(v, (dict, list)):
-                d = extract_updated_from_json_obj(v)
-                if d: return d
-    elif isinstance(obj, list):
-        for it in obj:
-            d = extract_updated_from_json_obj(it)
-            if d: return d
-    return None
+                if "." in v:
+                    codes.update(WCAG_CODE_RE.findall(v))
+                if need_keys and k is not None:
+                    lk = k.lower()
+                    if updated is None and any(tag in lk for tag in UPDATED_KEY_TAGS):
+                        m = DATE_ISO_RE.search(v)
+                        if m:
+                            updated = m.group(0)
+                    elif title is None and lk == "title" and v.strip():
+                        title = v.strip()
+                    need_keys = updated is None or title is None
+            elif isinstance(v, dict):
+                stack.append(iter(v.items()))
+                break
+            elif isinstance(v, list):
+                stack.append(zip(repeat(None), v))
+                break
+        else:
+            stack.pop()
+    return sorted(codes), updated, title
 
-def scrape_one(url: str, timeout=20):
+def fetch_html(url: str, timeout=20):
+    """Last ned siden (via uu_fetch-cachen). None ved feil eller status != 200."""
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=timeout)
-    except Exception as e:
-        return None, None, None
+        resp = uu_fetch.fetch(url, headers=HEADERS, timeout=timeout)
+    except Exception:
+        return None
     if resp.status_code != 200:
+        return None
+    return resp.text
+
+def scrape_one(url: str, timeout=20):
+    html = fetch_html(url, timeout=timeout)
+    if html is None:
         return None, None, None
+    return parse_html(html)
 
-    html = resp.text
-    soup = BeautifulSoup(html, "html.parser")
+def parse_html(html: str):
+    """Ren CPU-del av scrape_one: (codes, updated, title). Kjøres i prosesspoolen."""
+    if not html.strip():
+        return None, None, None
+    try:
+        doc = lxml.html.document_fromstring(html)
+    except ValueError:
+        # lxml godtar ikke str med <?xml encoding=...?>-deklarasjon
+        doc = lxml.html.document_fromstring(html.encode("utf-8"))
 
-    # 1) Prøv Next.js __NEXT_DATA__ (vanlig på moderne sider)
-    for script in soup.find_all("script"):
-        if script.get("id") == "__NEXT_DATA__" or (script.string and script.string.strip().startswith("{")):
-            try:
-                data = json.loads(script.string)
-                codes = extract_codes_from_json_obj(data)
-                upd = extract_updated_from_json_obj(data)
-                if codes:
-                    return uniq_sorted(codes), upd, soup.title.string.strip() if soup.title else None
-            except Exception:
-                pass
+    t = TITLE_XPATH(doc)
+    title = t[0].strip() or None if t else None
+
+    # 1) Next.js __NEXT_DATA__ (vanlig på moderne sider)
+    payload = NEXT_DATA_XPATH(doc)
+    if payload:
+        try:
+            codes, upd, json_title = walk_json(json.loads("".join(payload)))
+            if codes:
+                return codes, upd, title or json_title
+        except ValueError:
+            pass
 
     # 2) Fallback: skann all tekst i HTML for WCAG-koder
-    text = soup.get_text(separator=" ", strip=True)
+    text = " ".join(t for t in (n.strip() for n in TEXT_XPATH(doc)) if t)
     codes = uniq_sorted(WCAG_CODE_RE.findall(text))
 
     # 3) Finn oppdatert-dato i norsk format eller ISO i teksten
@@ -128,10 +152,99 @@ def scrape_one(url: str, timeout=20):
         if m_iso:
             upd = m_iso.group(0)
 
-    title = soup.title.string.strip() if soup.title else None
     return codes or None, upd, title
 
+def run_pipeline(jobs):
+    """Hent og parse `jobs` [(idx, url)] -> {idx: (codes, updated, title)}.
+
+    Nedlastingstrådene blokkerer på en kø med QUEUE_SIZE plasser, og maks
+    2 x PARSE_WORKERS sider er under parsing samtidig, så minnet holder seg flatt.
+    """
+    results = {}
+    if not jobs:
+        return results
+    q = queue.Queue(maxsize=QUEUE_SIZE)
+
+    def fetch_job(idx, url):
+        html = None
+        try:
+            html = fetch_html(url)
+        finally:
+            q.put((idx, html))
+
+    def collect(done):
+        for fut in done:
+            try:
+                results[fut.idx] = fut.result()
+            except Exception:
+                results[fut.idx] = (None, None, None)
+
+    with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as io_pool:
+        for idx, url in jobs:
+            io_pool.submit(fetch_job, idx, url)
+
+        if PARSE_WORKERS <= 0:
+            for _ in jobs:
+                idx, html = q.get()
+                try:
+                    results[idx] = parse_html(html) if html is not None else (None, None, None)
+                except Exception:
+                    results[idx] = (None, None, None)
+            return results
+
+        with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as cpu_pool:
+            pending = set()
+            for _ in jobs:
+                idx, html = q.get()
+                if html is None:
+                    results[idx] = (None, None, None)
+                    continue
+                fut = cpu_pool.submit(parse_html, html)
+                fut.idx = idx
+                pending.add(fut)
+                if len(pending) >= 2 * PARSE_WORKERS:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            collect(pending)
+    return results
+
+def source_sig(r):
+    """Signatur for det scrape-steget så av erklæringen (dato + koder fra lenker).
+
+    None hvis raden mangler disse feltene (eldre format / feil) -> alltid skitten.
+    """
+    if r.get("error") or ("source_updated" not in r and "codes" not in r):
+        return None
+    raw = json.dumps([r.get("source_updated") or "", r.get("codes") or []], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def load_state():
+    try:
+        st = json.loads(STATE_FP.read_text(encoding="utf-8"))
+        return st.get("urls") if isinstance(st.get("urls"), dict) else {}
+    except Exception:
+        return {}
+
+def is_dirty(r, url, state, full, now):
+    if full:
+        return True
+    prev = state.get(url)
+    sig = source_sig(r)
+    if not prev or sig is None or prev.get("sig") != sig:
+        return True
+    try:
+        enriched_at = datetime.fromisoformat(prev.get("enrichedAt"))
+    except Exception:
+        return True
+    return now - enriched_at > timedelta(days=MAX_AGE_DAYS)
+
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--full", action="store_true",
+                    default=os.getenv("UU_ENRICH_FULL", "").strip().lower() in ("1", "true", "yes", "on"),
+                    help="ignorer vannmerket og berik alle rader")
+    args = ap.parse_args()
+
     if not DETAILS_FP.exists():
         print("Fant ikke docs/uu-status-details.json", file=sys.stderr)
         sys.exit(1)
@@ -139,12 +252,43 @@ def main():
     obj = json.loads(DETAILS_FP.read_text(encoding="utf-8"))
     rows = obj.get("urls") if isinstance(obj, dict) else obj
 
-    updated = 0
+    state = load_state()
+    now = datetime.now(timezone.utc)
+
+    rows_with_url, jobs, results = [], [], {}
     for i, r in enumerate(rows):
         url = (r.get("url") or r.get("href") or "").strip()
         if not url:
             continue
-        codes, upd, title = scrape_one(url)
+        rows_with_url.append((i, url))
+        if is_dirty(r, url, state, args.full, now):
+            jobs.append((i, url))
+        else:
+            # uendret kilde: gjenbruk forrige resultat
+            prev = state[url]
+            results[i] = (prev.get("nonConformities"), prev.get("updatedAt"), prev.get("title"))
+    print(f"Inkrementell enrich: {len(jobs)} skitne, {len(rows_with_url) - len(jobs)} uendret"
+          + (" (--full)" if args.full else ""))
+    results.update(run_pipeline(jobs))
+
+    new_state = {}
+    now_iso = now.isoformat()
+    dirty = {i for i, _ in jobs}
+    for i, url in rows_with_url:
+        codes, upd, title = results[i]
+        if i in dirty:
+            if codes is None and upd is None and title is None:
+                continue  # henting/parsing feilet -> prøv igjen neste gang
+            new_state[url] = {"sig": source_sig(rows[i]), "enrichedAt": now_iso,
+                              "nonConformities": codes, "updatedAt": upd, "title": title}
+        else:
+            new_state[url] = state[url]
+
+    # slå sammen i opprinnelig rekkefølge -> deterministisk output
+    updated = 0
+    for i, url in rows_with_url:
+        r = rows[i]
+        codes, upd, title = results[i]
         if codes is not None:
             r["nonConformities"] = codes
             r["totalNonConformities"] = len(codes)
@@ -155,12 +299,13 @@ def main():
             r["title"] = title
         if not r.get("domain"):
             r["domain"] = to_domain(url)
-        # høflig throttle for å være snill med tjeneren
-        time.sleep(0.2)
 
     out = {"urls": rows} if isinstance(obj, dict) else rows
-    DETAILS_FP.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
+    static_out.write_json(DETAILS_FP, out, compress=True)   # hentes av uu-status.html / uu-arkiv.html
     print(f"Beriket {updated} av {len(rows)} entries med WCAG-koder.")
+    static_out.write_json(STATE_FP, {"urls": new_state})
+    uu_fetch.prune()
+    print(f"HTTP: {uu_fetch.stats()}")
 
 if __name__ == "__main__":
     main()
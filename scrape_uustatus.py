@@ -1,17 +1,28 @@
 #!/usr/bin/env python3
-import csv, re, time, json
-from datetime import datetime, timezone
+import argparse, csv, hashlib, io, os, re, json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-import requests
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
+import uu_fetch
+import static_out
 
 # Input og output
 INPUT_CSV = Path("uustatus-urls.csv")  # kildelista
 OUTPUT_CSV = Path("uu-status.csv")     # resultat-tabell
 DETAILS_JSON = Path("uu-status-details.json")  # nye detaljer per erklæring
+# Løpende resultat (én linje per erklæring) + sjekkpunkt for --resume; slettes etter komprimering
+PARTIAL_JSONL = Path("uu-status.partial.jsonl")
+CHECKPOINT_JSON = Path("uu-status.checkpoint.json")
+CHECKPOINT_EVERY = max(1, int(os.getenv("UU_CHECKPOINT_EVERY", "25")))  # rader mellom sjekkpunkt
 
 HEADERS = {"User-Agent": "toolsified-uustatus-scraper (+https://github.com/Almasy74/toolsified)"}
 
+# Samtidighet (kan overstyres via env). Høflighet per host styres i uu_fetch.
+CONCURRENCY = max(1, int(os.getenv("UU_CONCURRENCY", "8")))        # antall samtidige forespørsler
+
 # Regex-mønstre
 BRUDD_RE = re.compile(r"Det er brudd på\s+(\d+)\s+av\s+(\d+)\s+krav", re.IGNORECASE)
 SIST_OPPDATERT_RE = re.compile(r"sist oppdatert\s+(\d{1,2}\.\s*\w+\s*\d{4})", re.IGNORECASE)
@@ -19,79 +30,110 @@ OPPRETTET_RE = re.compile(r"opprettet (?:første\s*gang|første gang)\s+(\d{1,2}
 
 # Tre-nivå WCAG-koder (fanger f.eks. 1.4.3, 4.1.2)
 WCAG_CODE_RE = re.compile(r"\b[1-4]\.\d{1,2}\.\d{1,2}\b")
+WCAG_HREF_RE = re.compile(r"/wcag/([1-4]\.\d{1,2}\.\d{1,2})(?:\D|$)")  # typisk /wcag/4.1.2
 
 MONTHS = {
-    "januar":"January","februar":"February","mars":"March","april":"April",
-    "mai":"May","juni":"June","juli":"July","august":"August",
-    "september":"September","oktober":"October","november":"November","desember":"December"
+    "januar": 1, "februar": 2, "mars": 3, "april": 4, "mai": 5, "juni": 6,
+    "juli": 7, "august": 8, "september": 9, "oktober": 10, "november": 11, "desember": 12,
 }
+NO_DATE_RE = re.compile(r"(\d{1,2})\.\s*([^\W\d_]+)\s*(\d{4})")
 
+@lru_cache(maxsize=4096)
 def parse_no_date_to_iso(s):
-    if not s:
+    """'12. mars 2025' -> '2025-03-12' (tom streng hvis ukjent)."""
+    m = NO_DATE_RE.fullmatch((s or "").strip())
+    if not m:
+        return ""
+    month = MONTHS.get(m.group(2).lower())
+    if not month:
         return ""
-    raw = s.strip()
-    for no, en in MONTHS.items():
-        raw = re.sub(no, en, raw, flags=re.IGNORECASE)
     try:
-        from datetime import datetime
-        dt = datetime.strptime(raw.replace("  ", " "), "%d. %B %Y")
-        return dt.date().isoformat()
-    except Exception:
+        return date(int(m.group(3)), month, int(m.group(1))).isoformat()
+    except ValueError:
         return ""
 
+def _parse_html(html):
+    """lxml-dokument, eller None hvis siden ikke har noen elementer (bare doctype/kommentar)."""
+    try:
+        try:
+            return lxml.html.document_fromstring(html)
+        except ValueError:
+            # lxml godtar ikke str med <?xml encoding=...?>-deklarasjon
+            return lxml.html.document_fromstring(html.encode("utf-8"))
+    except etree.ParserError:
+        return None   # "Document is empty": gir tomme felt, som bs4 gjorde
+
+# Én forhåndskompilert XPath som gir både href-er og synlig tekst i dokumentrekkefølge
+# (samme tekst som soup.get_text(): uten script/style/template og kommentarer).
+FIELDS_XPATH = etree.XPath(
+    "//a/@href"
+    " | //text()[not(ancestor::script or ancestor::style or ancestor::template)]"
+)
+
+def extract_fields(html):
+    """Trekk ut brudd/krav, datoer og WCAG-koder i ett gjennomløp av dokumentet."""
+    chunks, href_codes = [], set()
+    doc = _parse_html(html) if html and html.strip() else None
+    if doc is not None:
+        for node in FIELDS_XPATH(doc):
+            if node.is_attribute:
+                m = WCAG_HREF_RE.search(node)
+                if m:
+                    href_codes.add(m.group(1))
+                continue
+            t = node.strip()
+            if t:
+                chunks.append(t)
+    text = " ".join(chunks)
+
+    m_brudd = BRUDD_RE.search(text)
+    m_upd = SIST_OPPDATERT_RE.search(text)
+    m_created = OPPRETTET_RE.search(text)
+
+    # fallback: regex i ren tekst hvis ingen lenker ga koder
+    codes = href_codes or set(WCAG_CODE_RE.findall(text))
+
+    return {
+        "brudd": m_brudd.group(1) if m_brudd else "",
+        "krav": m_brudd.group(2) if m_brudd else "",
+        "updated": parse_no_date_to_iso(m_upd.group(1)) if m_upd else "",
+        "created": parse_no_date_to_iso(m_created.group(1)) if m_created else "",
+        "codes": sorted(codes),  # stabil rekkefølge
+    }
+
+def error_result(name, url, status, e):
+    now = datetime.now(timezone.utc).isoformat()
+    return (
+        {
+            "Navn": name, "Url": url, "Brudd": "", "KravTotalt": "", "SistOppdatert": "",
+            "Opprettet": "", "Statuskode": status, "Feil": str(e), "SistSjekket": now, "WCAGCodes": ""
+        },
+        {"url": url, "name": name, "codes": [], "last_checked": now, "error": str(e)}
+    )
+
 def scrape_one(name, url):
     try:
-        r = requests.get(url, headers=HEADERS, timeout=30)
+        r = uu_fetch.fetch(url, headers=HEADERS, timeout=30)
         status = r.status_code
         html = r.text
     except Exception as e:
-        now = datetime.now(timezone.utc).isoformat()
-        return (
-            {
-                "Navn": name, "Url": url, "Brudd": "", "KravTotalt": "", "SistOppdatert": "",
-                "Opprettet": "", "Statuskode": "", "Feil": str(e), "SistSjekket": now, "WCAGCodes": ""
-            },
-            {"url": url, "name": name, "codes": [], "last_checked": now, "error": str(e)}
-        )
-
-    soup = BeautifulSoup(html, "lxml")
-    text = soup.get_text(" ", strip=True)
-
-    # brudd / krav
-    m_brudd = BRUDD_RE.search(text)
-    brudd = m_brudd.group(1) if m_brudd else ""
-    krav = m_brudd.group(2) if m_brudd else ""
+        return error_result(name, url, "", e)
 
-    # datoer
-    m_upd = SIST_OPPDATERT_RE.search(text)
-    m_created = OPPRETTET_RE.search(text)
-    updated_iso = parse_no_date_to_iso(m_upd.group(1)) if m_upd else ""
-    created_iso = parse_no_date_to_iso(m_created.group(1)) if m_created else ""
-
-    # forsøk 1: finn WCAG-koder via lenker/href
-    codes = set()
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        # typisk /wcag/4.1.2 eller lignende
-        m = re.search(r"/wcag/([1-4]\.\d{1,2}\.\d{1,2})(?:\D|$)", href)
-        if m:
-            codes.add(m.group(1))
-
-    # fallback: regex i ren tekst
-    if not codes:
-        for m in WCAG_CODE_RE.finditer(text):
-            codes.add(m.group(0))
-
-    codes = sorted(codes)  # stabil rekkefølge
+    try:
+        fields = extract_fields(html)
+    except Exception as e:
+        # én side som ikke lar seg parse skal gi en feilrad, ikke stoppe hele kjøringen
+        return error_result(name, url, status, e)
+    codes = fields["codes"]
     now = datetime.now(timezone.utc).isoformat()
 
     row = {
         "Navn": name,
         "Url": url,
-        "Brudd": brudd,
-        "KravTotalt": krav,
-        "SistOppdatert": updated_iso,
-        "Opprettet": created_iso,
+        "Brudd": fields["brudd"],
+        "KravTotalt": fields["krav"],
+        "SistOppdatert": fields["updated"],
+        "Opprettet": fields["created"],
         "Statuskode": status,
         "Feil": "",
         "SistSjekket": now,
@@ -102,6 +144,7 @@ def scrape_one(name, url):
         "url": url,
         "name": name,
         "codes": codes,              # array for enklere frontend-bruk
+        "source_updated": fields["updated"],  # brukes av inkrementell enrich
         "last_checked": now
     }
 
@@ -116,25 +159,55 @@ def read_sources(path: Path):
             if name and url:
                 yield name, url
 
+def compact(log):
+    """JSONL -> uu-status.csv + uu-status-details.json (samme format som før), uten å holde alt i minnet."""
+    fieldnames = ["Navn","Url","Brudd","KravTotalt","SistOppdatert","Opprettet","Statuskode","Feil","SistSjekket","WCAGCodes"]
+    with static_out.atomic_open(OUTPUT_CSV) as f:
+        buf = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        writer = csv.DictWriter(buf, fieldnames=fieldnames, delimiter=';')
+        writer.writeheader()
+        for rec in log.records():
+            writer.writerow(rec["row"])
+        buf.flush()
+        buf.detach()
+    static_out.write_json_array(DETAILS_JSON, (rec["detail"] for rec in log.records()))
+
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--resume", action="store_true",
+                    help=f"fortsett fra {CHECKPOINT_JSON} etter en avbrutt kjøring")
+    args = ap.parse_args()
+
     if not INPUT_CSV.exists():
         raise SystemExit(f"Mangler {INPUT_CSV}. Opprett en semikolon-CSV med header 'Navn;Url'.")
 
-    rows, details = [], []
-    for name, url in read_sources(INPUT_CSV):
-        row, detail = scrape_one(name, url)
-        rows.append(row)
-        details.append(detail)
-        time.sleep(0.8)
-
-    fieldnames = ["Navn","Url","Brudd","KravTotalt","SistOppdatert","Opprettet","Statuskode","Feil","SistSjekket","WCAGCodes"]
-    with OUTPUT_CSV.open("w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=';')
-        writer.writeheader()
-        writer.writerows(rows)
-
-    with DETAILS_JSON.open("w", encoding="utf-8") as jf:
-        json.dump(details, jf, ensure_ascii=False, indent=2)
+    sources = list(read_sources(INPUT_CSV))
+    sources_sig = hashlib.sha1(json.dumps(sources, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    log = static_out.JsonlCheckpoint(PARTIAL_JSONL, CHECKPOINT_JSON)
+    saved = log.open(resume=args.resume)
+    done = 0
+    if saved and saved.get("sources") == sources_sig:
+        done = saved["done"]
+        print(f"Fortsetter etter {done} av {len(sources)} erklæringer")
+    elif saved:
+        print("Kildelista er endret siden sjekkpunktet, starter på nytt")
+        log.open(resume=False)
+    print(f"Henter {len(sources) - done} erklæringer (samtidighet={CONCURRENCY}, {uu_fetch.RATE_PER_HOST}/s per host)")
+
+    # executor.map returnerer i samme rekkefølge som input -> done er en ren markør i sources
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        for done, (row, detail) in enumerate(pool.map(lambda src: scrape_one(*src), sources[done:]), start=done + 1):
+            log.append({"row": row, "detail": detail})
+            if done % CHECKPOINT_EVERY == 0:
+                log.checkpoint({"sources": sources_sig, "done": done})
+    log.checkpoint({"sources": sources_sig, "done": done})
+
+    compact(log)
+    log.finish()
+
+    uu_fetch.prune()
+    print(f"HTTP: {uu_fetch.stats()}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Mikro-benchmark for feltuttrekket i crawl_ds.py (ds_extract.extract).
+
+Bruk:
+  python scripts/python/bench_crawl_parse.py                 # sidene i docs/find/crawl.json
+  python scripts/python/bench_crawl_parse.py sider/ a.html   # lagrede .html-filer / kataloger
+  python scripts/python/bench_crawl_parse.py --repeat 20
+
+Sidene i crawl.json hentes én gang til .cache/ds-pages/ og brukes derfra som
+fixtures. Sammenligner mot den gamle BeautifulSoup-varianten og sjekker at
+begge gir samme felt, brødtekst og lenker.
+"""
+import argparse, hashlib, json, sys, time
+from pathlib import Path
+
+import requests
+import ds_extract
+
+FIXTURE_DIR = Path(".cache/ds-pages")
+HEADERS = {"User-Agent": "ds-crawler/0.3"}
+
+
+def fixture_pages(crawl_fp, timeout):
+    docs = json.loads(Path(crawl_fp).read_text(encoding="utf-8"))
+    pages = []
+    for d in docs:
+        if d.get("error"):
+            continue
+        fp = FIXTURE_DIR / (hashlib.sha1(d["url"].encode("utf-8")).hexdigest() + ".html")
+        if not fp.exists():
+            try:
+                r = requests.get(d["url"], headers=HEADERS, timeout=timeout)
+                r.raise_for_status()
+            except Exception as e:
+                print(f"  hopper over {d['url']}: {e}", file=sys.stderr)
+                continue
+            FIXTURE_DIR.mkdir(parents=True, exist_ok=True)
+            fp.write_text(r.text, encoding="utf-8")
+        pages.append((d["url"], fp.read_text(encoding="utf-8")))
+    return pages
+
+
+def load_pages(paths):
+    pages = []
+    for p in paths:
+        p = Path(p)
+        files = sorted(p.rglob("*")) if p.is_dir() else [p]
+        for fp in files:
+            if fp.suffix in (".html", ".htm"):
+                pages.append((fp.as_posix(), fp.read_text(encoding="utf-8", errors="replace")))
+    return pages
+
+
+def legacy_extract(url, html):
+    """Referanse: slik crawl_ds parset før (full soup + select/find_next_sibling)."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "lxml")
+    title = (soup.title.string or "").strip() if soup.title else url
+    name = title.replace(" - Skatteetaten", "").strip() or title
+
+    md = soup.select_one('meta[name="description"]')
+    if md and md.get("content"):
+        summary = md["content"].strip()[:400]
+    else:
+        p = soup.select_one("main p, article p, .content p, p")
+        summary = p.get_text(" ", strip=True)[:400] if p else ""
+
+    section_headings = ["Tilgjengelighet", "Bruk", "Best practice", "God praksis", "Do", "Don't", "Obs", "Anbefalinger"]
+    tips = []
+    for h in soup.select("h2, h3"):
+        t = h.get_text(" ", strip=True)
+        if any(s.lower() in t.lower() for s in section_headings):
+            sib = h.find_next_sibling()
+            while sib and sib.name not in ("ul", "ol") and sib.name not in ("h2", "h3"):
+                sib = sib.find_next_sibling()
+            if sib and sib.name in ("ul", "ol"):
+                for li in sib.select("li")[:8]:
+                    t = li.get_text(" ", strip=True)
+                    if t:
+                        tips.append(t)
+    if not tips:
+        for sel in ['section[aria-labelledby*="tilgjeng"] ul', 'section[aria-labelledby*="bruk"] ul']:
+            for li in soup.select(f"{sel} li")[:8]:
+                t = li.get_text(" ", strip=True)
+                if t:
+                    tips.append(t)
+
+    fields = {
+        "title": title,
+        "name": name,
+        "type": ds_extract.classify_type(url),
+        "summary": summary,
+        "tips": tips[:12],
+        "anchors": [h.get_text(" ", strip=True) for h in soup.select("h2, h3")][:30],
+    }
+    main = soup.select_one("main") or soup.select_one('[role="main"]') or soup.select_one("article")
+    return fields, (main.get_text(" ", strip=True) if main else None), [a.get("href") for a in soup.select("a[href]")]
+
+
+def bench(fn, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for url, html in pages:
+            fn(url, html)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(pages) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("paths", nargs="*", help="lagrede .html-filer/kataloger (default: sidene i --crawl)")
+    ap.add_argument("--crawl", default="docs/find/crawl.json")
+    ap.add_argument("--timeout", type=int, default=10)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--no-legacy", action="store_true", help="hopp over BeautifulSoup-referansen")
+    args = ap.parse_args()
+
+    pages = load_pages(args.paths) if args.paths else fixture_pages(args.crawl, args.timeout)
+    if not pages:
+        print(f"Fant ingen sider i {args.paths or args.crawl}", file=sys.stderr)
+        sys.exit(1)
+
+    size_kb = sum(len(h) for _, h in pages) / len(pages) / 1024
+    print(f"{len(pages)} sider, snitt {size_kb:.1f} KB, beste av {args.repeat} runder")
+
+    new_ms = bench(ds_extract.extract, pages, args.repeat)
+    print(f"  ds_extract     : {new_ms:8.3f} ms/side")
+
+    if not args.no_legacy:
+        old_ms = bench(legacy_extract, pages, args.repeat)
+        print(f"  legacy (bs4)   : {old_ms:8.3f} ms/side  ({old_ms / new_ms:.1f}x)")
+        diff = [url for url, html in pages if ds_extract.extract(url, html) != legacy_extract(url, html)]
+        if diff:
+            print(f"  ADVARSEL: ulikt resultat for {len(diff)} sider, f.eks. {diff[0]}")
+
+
+if __name__ == "__main__":
+    main()
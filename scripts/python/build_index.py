@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
-import argparse, json, os, re
+import argparse, hashlib, json, os, sys
 from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))   # repo-roten: static_out.py
+import static_out
+import search_index   # BM25-postinger + prefiks-trie, ligger ved siden av dette skriptet
 
 ap = argparse.ArgumentParser()
 ap.add_argument("--knowledge", required=True)
 ap.add_argument("--crawl", required=True)
 ap.add_argument("--out", required=True)
+ap.add_argument("--cache", default=".cache/find-index/build-cache.json",
+                help="byggecache fra forrige kjøring (normaliserte dokumenter + analysen av dem)")
+ap.add_argument("--full", action="store_true", help="ignorer byggecachen og bygg alt på nytt")
 args = ap.parse_args()
 
 def read_json(path, default=None):
@@ -17,12 +25,28 @@ def read_json(path, default=None):
         return default
 
 def write_json(path, data):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    static_out.write_json(path, data, compress=True)   # index.json hentes av find/app.js
+
+toks = search_index.toks
 
-def toks(s):
-    return re.findall(r"[a-zæøå0-9]+", (s or "").lower())
+# --- 0) Byggecache ---
+# Normalisert dokument (steg 2/4) per innholdshash av kildeposten, pluss analysen
+# search_index.build() gjenbruker. Ugyldig når dette skriptet eller search_index.py endres.
+CACHE_VERSION = search_index.content_hash([Path(__file__).read_text(encoding="utf-8"),
+                                           search_index.analysis_version()])[:12]
+build_cache = {} if args.full else read_json(args.cache, default={})
+if not isinstance(build_cache, dict) or build_cache.get("version") != CACHE_VERSION:
+    build_cache = {}
+prev_records = build_cache.get("records") or {}
+records = {}   # innholdshash -> {"key": kilde:url/id, "record": normalisert dokument}
+
+def cached(kind, raw, key, normalize):
+    """normalize(raw), eller forrige kjørings resultat hvis kildeposten er uendret."""
+    h = search_index.content_hash([kind, raw])
+    hit = prev_records.get(h)
+    rec = dict(hit["record"]) if hit else normalize(raw)
+    records[h] = {"key": f"{kind}:{key}", "record": dict(rec)}   # kopi: steg 5 legger til bilde
+    return rec
 
 # --- 1) Les kilder ---
 crawl = read_json(args.crawl, default=[])
@@ -33,10 +57,7 @@ manual_components = read_json(os.path.join(args.knowledge, "components.json"), d
 manual_patterns   = read_json(os.path.join(args.knowledge, "patterns.json"),   default=[])
 
 # --- 2) Normaliser crawl og lag tokens ---
-normed = []
-for d in crawl:
-    if not isinstance(d, dict):
-        continue
+def normalize_crawl(d):
     url     = d.get("url")
     title   = d.get("title") or ""
     name    = d.get("name")  or title.replace(" - Skatteetaten","").strip() or title
@@ -49,7 +70,7 @@ for d in crawl:
     token_source = " ".join([title, name, summary, " ".join(anchors)])
     tokens = toks(token_source)
 
-    normed.append({
+    return {
         "url": url,
         "title": title,
         "name": name,
@@ -59,7 +80,9 @@ for d in crawl:
         "anchors": anchors,
         "depth": depth,
         "tokens": tokens
-    })
+    }
+
+normed = [cached("crawl", d, d.get("url"), normalize_crawl) for d in crawl if isinstance(d, dict)]
 
 # --- 3) Del i komponenter / mønstre / øvrige docs ---
 crawl_components = [d for d in normed if d.get("type") == "component"]
@@ -99,6 +122,7 @@ def adapt_manual_component(c):
         "summary": "",
         "tips": c.get("uu") or [],
         "anchors": [],
+        "keywords": c.get("aliases") or [],
         "depth": None,
         "tokens": toks(" ".join([name or "", " ".join(c.get("aliases", []))]))
     }
@@ -118,17 +142,20 @@ def adapt_manual_pattern(p):
         "summary": p.get("summary") or "",
         "tips": (p.get("uu_check") or []) + (p.get("common_pitfalls") or []),
         "anchors": [],
+        "keywords": p.get("intent") or [],
         "depth": None,
         "tokens": tokens
     }
 
 merged_components = uniq_by(
-    crawl_components + [adapt_manual_component(c) for c in manual_components],
+    crawl_components + [cached("component", c, comp_key(c), adapt_manual_component)
+                        for c in manual_components],
     comp_key
 )
 
 merged_patterns = uniq_by(
-    crawl_patterns + [adapt_manual_pattern(p) for p in manual_patterns],
+    crawl_patterns + [cached("pattern", p, pat_key(p), adapt_manual_pattern)
+                      for p in manual_patterns],
     pat_key
 )
 
@@ -142,22 +169,111 @@ for d in merged_components:
         if "/komponenter/table" in u:
             d["image"] = "./screenshots/table-default.png"
 
-# --- 6) Bygg endelig index ---
+# --- 6) Søkestruktur ---
+# Hvert dokument får en heltalls-id (= plass i doc-tabellen). Crawl-komponenter/-mønstre
+# er samme dict i components/patterns og all_docs og får dermed samme id.
+# Postingene peker på id-ene.
+doc_ids = {}
+search_docs = []
+for d in all_docs + merged_components + merged_patterns:
+    if id(d) not in doc_ids:
+        doc_ids[id(d)] = len(search_docs)
+        search_docs.append((doc_ids[id(d)], d))
+corpus, search_cache, changes = search_index.build(search_docs, aliases, build_cache.get("search"))
+
+# --- 7) Skriv shards + manifest ---
+# index.json er bare et lite manifest. Søkestrukturen ligger i term-shards (delt på
+# prefiks) og trigram-shards, dokumentene i biter à DOC_CHUNK, alt under index/ med
+# innholdshash i navnet (kan caches for alltid, se _headers). find/app.js henter bare
+# shardene og dokumentbitene en spørring trenger.
+INDEX_DIR = Path(args.out).parent / "index"
+DOC_CHUNK = 64
+
+parts = {"written": 0, "unchanged": 0, "removed": 0}
+
+def write_part(kind, obj):
+    data = static_out.dumps(obj)
+    name = f"{kind}.{hashlib.sha256(data).hexdigest()[:10]}.json"
+    if (INDEX_DIR / name).exists():
+        parts["unchanged"] += 1   # samme innhold som før: bare pek på fila
+    else:
+        static_out.atomic_write_bytes(INDEX_DIR / name, data)
+        parts["written"] += 1
+    return f"index/{name}"
+
+def manifest_files(m):
+    if not isinstance(m, dict) or m.get("format") != 3:
+        return set()
+    s = m.get("search") or {}
+    return {*m["docs"]["files"], *s["terms"].values(), *s["grams"].values(), s["vocab"]}
+
+term_shards, gram_shards = search_index.shard(corpus)
+# felles ordliste: doc.tokens er id-er inn i denne (brukes ikke av søket)
+vocab = sorted(corpus["forms"])
+vocab_ids = {f: i for i, f in enumerate(vocab)}
+docs_table = [{**d, "tokens": [vocab_ids[t] for t in d["tokens"] if t in vocab_ids]} for _, d in search_docs]
+ids_of = lambda items: [doc_ids[id(d)] for d in items]
+
 index = {
     "generated": True,
     "generated_at": datetime.now(timezone.utc).isoformat(),
+    "format": 3,   # 3: manifest + shards under index/
 
-    # Søkegrunnlag
-    "components": merged_components,
-    "patterns": merged_patterns,
-    "all_docs": all_docs,
+    # Søkegrunnlag: id-lister; dokumentene ligger i docs.files[id // chunkSize]
+    "docs": {
+        "count": len(docs_table),
+        "chunkSize": DOC_CHUNK,
+        "files": [write_part("d", docs_table[i:i + DOC_CHUNK]) for i in range(0, len(docs_table), DOC_CHUNK)],
+    },
+    "components": ids_of(merged_components),
+    "patterns": ids_of(merged_patterns),
+    "all_docs": ids_of(all_docs),
 
-    # Alias-ordbok (for UI til å gjøre ekstra matching hvis ønskelig)
-    "aliases": aliases,
+    # BM25-parametre og shard-filer (se search_index.py)
+    "search": {
+        **search_index.params(),
+        "terms": {key: write_part("t", sh) for key, sh in sorted(term_shards.items())},
+        "grams": {c: write_part("g", sh) for c, sh in sorted(gram_shards.items())},
+        "vocab": write_part("v", vocab),
+    },
 }
 
+previous = read_json(args.out, default={})
 write_json(args.out, index)
+
+# rydd shards som verken dette eller forrige manifest bruker (forrige beholdes, så en
+# side som nettopp lastet det gamle manifestet fortsatt finner filene sine)
+keep = manifest_files(index) | manifest_files(previous)
+for fp in INDEX_DIR.glob("*.json"):
+    if f"index/{fp.name}" not in keep:
+        fp.unlink()
+        parts["removed"] += 1
+
+static_out.write_json(args.cache, {"version": CACHE_VERSION, "records": records, "search": search_cache})
+
 print(
     f"Wrote index to {args.out} "
-    f"({len(merged_components)} components, {len(merged_patterns)} patterns, {len(all_docs)} docs)"
+    f"({len(merged_components)} components, {len(merged_patterns)} patterns, {len(all_docs)} docs, "
+    f"{len(corpus['postings'])} terms in {len(term_shards)} shards, {len(index['docs']['files'])} doc chunks)"
 )
+
+# --- 8) Hva endret seg siden forrige bygg ---
+prev_keys = {r["key"]: h for h, r in prev_records.items()}
+cur_keys = {r["key"]: h for h, r in records.items()}
+added = [k for k in cur_keys if k not in prev_keys]
+removed = [k for k in prev_keys if k not in cur_keys]
+changed = [k for k in cur_keys if k in prev_keys and prev_keys[k] != cur_keys[k]]
+if not prev_records:
+    print("Inkrementelt bygg: ingen brukbar cache" + (" (--full)" if args.full else "") + ", bygget alt")
+else:
+    print(f"Inkrementelt bygg: {len(added)} nye, {len(changed)} endret, {len(removed)} fjernet, "
+          f"{len(cur_keys) - len(added) - len(changed)} uendret kildeposter")
+    for label, keys in (("ny", added), ("endret", changed), ("fjernet", removed)):
+        for k in keys[:10]:
+            print(f"  {label}: {k}")
+        if len(keys) > 10:
+            print(f"  ... og {len(keys) - 10} til ({label})")
+print(f"  analyse: {changes['analyzed']} analysert, {changes['rematched']} alias-matchet på nytt, "
+      f"{changes['reused']} gjenbrukt; {changes['resplit']} ord delt på nytt"
+      + ("; aliaser endret" if changes["aliasesChanged"] else ""))
+print(f"  filer under index/: {parts['written']} skrevet, {parts['unchanged']} uendret, {parts['removed']} slettet")
@@ -1,5 +1,11 @@
-import argparse, json, urllib.parse, requests
-from bs4 import BeautifulSoup
+import argparse, hashlib, json, re, sys, threading, urllib.parse, requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import ds_extract   # feltuttrekk (lxml), ligger ved siden av dette skriptet
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))   # repo-roten: static_out.py
+import static_out
 
 ap = argparse.ArgumentParser()
 ap.add_argument("--sources", required=True)
@@ -7,13 +13,35 @@ ap.add_argument("--out", required=True)
 ap.add_argument("--max-depth", type=int, default=3)   # 0 = bare nav, 1 = ett nivå ned, osv.
 ap.add_argument("--max-pages", type=int, default=400)
 ap.add_argument("--timeout", type=int, default=10)
+ap.add_argument("--concurrency", type=int, default=8)  # samtidige forespørsler
+ap.add_argument("--state", help="crawl-tilstand for inkrementell recrawl (default: <out>-state.json ved siden av --out)")
+ap.add_argument("--full", action="store_true", help="ignorer lagret tilstand og hent/parse alt på nytt")
+ap.add_argument("--resume", action="store_true", help="fortsett en avbrutt crawl fra sjekkpunktet (<out>.checkpoint.json)")
 args = ap.parse_args()
 
 def norm_url(base, href):
-    """Løs opp relative lenker, fjern fragment, normaliser trailing slash."""
+    """Løs opp relative lenker og kanoniser før URL-en legges i køen.
+
+    - fjern fragment og trailing slash
+    - små bokstaver i skjema og host, dropp standardport
+    - små bokstaver i stien bare der sources.json slår det på: "foldCase": true (alle
+      hoster) eller en liste med hoster (med ev. port) som ikke skiller på store/små
+      bokstaver. Default av: på vanlige servere er /Side og /side to sider.
+    - behold bare query-parametre i "keepParams" (default ingen), sortert
+      -> sporingsparametre og andre varianter blir samme URL
+    """
     if not href:
         return None
     u = urllib.parse.urljoin(base, href.split('#')[0])
+    pu = urllib.parse.urlsplit(u)
+    scheme = pu.scheme.lower()
+    host = (pu.hostname or "").lower()
+    if pu.port and (scheme, pu.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{pu.port}"
+    path = pu.path.lower() if FOLD_CASE is True or host in FOLD_CASE else pu.path
+    query = urllib.parse.urlencode(sorted(
+        (k, v) for k, v in urllib.parse.parse_qsl(pu.query, keep_blank_values=True) if k in KEEP_PARAMS))
+    u = urllib.parse.urlunsplit((scheme, host, path, query, ""))
     if u.endswith('/'):
         u = u[:-1]
     return u
@@ -21,8 +49,14 @@ def norm_url(base, href):
 with open(args.sources, "r", encoding="utf-8") as f:
     src = json.load(f)
 
+KEEP_PARAMS = set(src.get("keepParams", []))
+FOLD_CASE = src.get("foldCase", False)   # true/false eller [host, ...]
+if FOLD_CASE is not True:
+    FOLD_CASE = {h.lower() for h in FOLD_CASE} if isinstance(FOLD_CASE, list) else set()
+SIMHASH_MAX_DISTANCE = int(src.get("simhashMaxDistance", 3))   # 0 = kun eksakte duplikater, -1 = av
+
 # Normaliser rot-URLer og avgrens til disse
-roots = [u.rstrip('/') for u in src.get("nav", [])]
+roots = [norm_url(u, u) for u in src.get("nav", [])]
 allowed_hosts = {urllib.parse.urlparse(u).netloc for u in roots}
 
 def allowed(u: str) -> bool:
@@ -32,113 +66,254 @@ def allowed(u: str) -> bool:
         return False
     return any(u.startswith(r) for r in roots)
 
-seen = set()
-queue = [(r, 0) for r in roots]
-docs  = []
-
-def text_or_none(soup: BeautifulSoup, selector: str):
-    el = soup.select_one(selector)
-    return el.get_text(" ", strip=True) if el else None
-
-def classify_type(url: str) -> str:
-    ul = url.lower()
-    if "/designsystemet/komponenter/" in ul:
-        return "component"
-    if "/monster/" in ul:
-        return "pattern"
-    return "doc"
-
-def extract_summary(soup: BeautifulSoup) -> str:
-    # Prøv meta description først
-    md = soup.select_one('meta[name="description"]')
-    if md and md.get("content"):
-        return md["content"].strip()[:400]
-    # Ellers første avsnitt
-    p = soup.select_one("main p, article p, .content p, p")
-    if p:
-        return p.get_text(" ", strip=True)[:400]
-    return ""
-
-def extract_tips(soup: BeautifulSoup) -> list:
-    """Finn kuler/ol-li under seksjoner med relevante overskrifter."""
-    section_headings = ["Tilgjengelighet", "Bruk", "Best practice", "God praksis", "Do", "Don't", "Obs", "Anbefalinger"]
-    tips = []
-    # gå gjennom H2/H3 og se etter ul/ol rett etterpå
-    for h in soup.select("h2, h3"):
-        title = h.get_text(" ", strip=True)
-        if any(s.lower() in title.lower() for s in section_headings):
-            # finn første liste etter overskriften (søskene)
-            sib = h.find_next_sibling()
-            while sib and sib.name not in ("ul", "ol") and sib.name not in ("h2", "h3"):
-                sib = sib.find_next_sibling()
-            if sib and sib.name in ("ul", "ol"):
-                for li in sib.select("li")[:8]:
-                    t = li.get_text(" ", strip=True)
-                    if t:
-                        tips.append(t)
-    # fallbacks: se etter lister inne i seksjoner som åpenbart er “tilgjengelighet” osv.
-    if not tips:
-        for sel in ['section[aria-labelledby*="tilgjeng"] ul', 'section[aria-labelledby*="bruk"] ul']:
-            for li in soup.select(f"{sel} li")[:8]:
-                t = li.get_text(" ", strip=True)
-                if t:
-                    tips.append(t)
-    return tips[:12]
-
-def extract_anchors(soup: BeautifulSoup) -> list:
-    return [h.get_text(" ", strip=True) for h in soup.select("h2, h3")][:30]
-
-while queue and len(seen) < args.max_pages:
-    url, depth = queue.pop(0)
-    if url in seen or not allowed(url):
-        continue
-    seen.add(url)
+HEADERS = {"User-Agent": "ds-crawler/0.3"}
+SKIP_EXT = (".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".zip", ".doc", ".docx", ".xls", ".xlsx")
+
+_local = threading.local()
+
+def session() -> requests.Session:
+    """Én Session (keep-alive-pool) per tråd."""
+    s = getattr(_local, "session", None)
+    if s is None:
+        s = _local.session = requests.Session()
+    return s
+
+# ---------- nesten-duplikater (SimHash) ----------
+SIMHASH_BITS = 64
+SIMHASH_MIN_TOKENS = 8     # for lite tekst -> ingen dedup (tomme maler ville kollapset)
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def simhash(text: str):
+    """64-bits SimHash over 3-ords-shingles av teksten, None hvis ingen/for lite tekst."""
+    if text is None:
+        return None   # uten hovedinnhold: bare eksakt URL-kanonisering
+    words = WORD_RE.findall(text.lower())
+    if len(words) < SIMHASH_MIN_TOKENS:
+        return None
+    shingles = {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+    hashes = [int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big") for sh in shingles]
+    half = len(hashes) / 2
+    out = 0
+    for i in range(SIMHASH_BITS):
+        if sum((h >> i) & 1 for h in hashes) > half:
+            out |= 1 << i
+    return out
+
+class NearDupIndex:
+    """Finn tidligere SimHash innen `max_distance` bit. Med 4 bånd à 16 bit deler
+    to hasher med avstand <= 3 minst ett bånd eksakt (dueskuffprinsippet)."""
+    BANDS = 4
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        self.buckets = {}
+
+    def _bands(self, h: int):
+        w = SIMHASH_BITS // self.BANDS
+        return [(b, (h >> (b * w)) & ((1 << w) - 1)) for b in range(self.BANDS)]
+
+    def find(self, h: int):
+        for key in self._bands(h):
+            for other, ref in self.buckets.get(key, ()):
+                if bin(h ^ other).count("1") <= self.max_distance:
+                    return ref
+        return None
+
+    def add(self, h: int, ref):
+        for key in self._bands(h):
+            self.buckets.setdefault(key, []).append((h, ref))
+
+# Inkrementell recrawl: per URL lagres validatorer (ETag/Last-Modified), sha1 av body,
+# ekstraherte felt og utlenker. 304 eller samme hash -> ingen parsing, lagrede
+# felt og lenker gjenbrukes.
+STATE_FP = Path(args.state) if args.state else Path(args.out).with_name(Path(args.out).stem + "-state.json")
+DOC_FIELDS = ("title", "name", "type", "summary", "tips", "anchors")
+
+STATE_VERSION = 3   # 2: simhash per side, 3: simhash kun av hovedinnholdet
 
+def load_state():
+    if args.full:
+        return {}
     try:
-        r = requests.get(url, timeout=args.timeout, headers={"User-Agent": "ds-crawler/0.3"})
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "lxml")
-
-        title = (soup.title.string or "").strip() if soup.title else url
-        name = title.replace(" - Skatteetaten", "").strip() or title
-        doc_type = classify_type(url)
-        summary = extract_summary(soup)
-        tips = extract_tips(soup)
-        anchors = extract_anchors(soup)
-
-        docs.append({
-            "url": url,
-            "title": title,
-            "name": name,
-            "type": doc_type,
-            "depth": depth,
-            "summary": summary,
-            "tips": tips,
-            "anchors": anchors
-        })
-
-        # følg lenker videre inntil max-depth
-        if depth < args.max_depth:
-            for a in soup.select("a[href]"):
-                u = norm_url(url, a.get("href"))
-                if not u:
-                    continue
-                # dropp filer vi ikke vil ha
-                low = u.lower()
-                if low.endswith((".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".zip", ".doc", ".docx", ".xls", ".xlsx")):
-                    continue
-                if allowed(u) and u not in seen:
-                    queue.append((u, depth + 1))
+        st = json.loads(STATE_FP.read_text(encoding="utf-8"))
+        if st.get("version") != STATE_VERSION:
+            return {}
+        return st.get("pages") if isinstance(st.get("pages"), dict) else {}
+    except Exception:
+        return {}
+
+prev_state = load_state()
+
+def parse_page(url: str, html: str):
+    """Full parsing: (felt, utlenker, simhash). Utlenkene lagres uten dybde-/rot-filter."""
+    fields, text, hrefs = ds_extract.extract(url, html)
+    sh = simhash(text)
+    links, seen_links = [], set()
+    for href in hrefs:
+        u = norm_url(url, href)
+        # dropp filer vi ikke vil ha
+        if not u or u in seen_links or u.lower().endswith(SKIP_EXT):
+            continue
+        seen_links.add(u)
+        links.append(u)
+    return fields, links, (format(sh, "016x") if sh is not None else None)
+
+def crawl_one(url: str, depth: int):
+    """Hent én side -> (doc, utlenker, ny tilstand, status). Kjøres i trådpoolen.
+
+    status: "not_modified" (304), "same_hash" (body uendret), "parsed" eller "error".
+    """
+    prev = prev_state.get(url)
+    headers = dict(HEADERS)
+    if prev:
+        if prev.get("etag"):
+            headers["If-None-Match"] = prev["etag"]
+        if prev.get("lastModified"):
+            headers["If-Modified-Since"] = prev["lastModified"]
+    try:
+        r = session().get(url, timeout=args.timeout, headers=headers)
+        if r.status_code == 304 and prev:
+            entry, status = dict(prev), "not_modified"
+        else:
+            r.raise_for_status()
+            digest = hashlib.sha1(r.content).hexdigest()
+            if prev and prev.get("hash") == digest:
+                entry, status = dict(prev), "same_hash"
+            else:
+                fields, links, sh = parse_page(url, r.text)
+                entry, status = {"hash": digest, "fields": fields, "links": links, "simhash": sh}, "parsed"
+            entry["etag"] = r.headers.get("ETag")
+            entry["lastModified"] = r.headers.get("Last-Modified")
+        doc = {"url": url, **{k: entry["fields"][k] for k in DOC_FIELDS[:3]}, "depth": depth,
+               **{k: entry["fields"][k] for k in DOC_FIELDS[3:]}}
+        return doc, entry["links"], entry, status
 
     except Exception as e:
-        docs.append({
+        # forbigående feil (5xx, tidsavbrudd): behold forrige tilstand og utlenker, så
+        # siden og det som bare nås via den ikke meldes som fjernet og parses på nytt
+        return {
             "url": url,
             "error": str(e),
             "type": "error",
             "depth": depth
-        })
+        }, (prev or {}).get("links") or [], dict(prev) if prev else None, "error"
+
+# Hver behandlet side skrives straks som én linje i <out>.partial.jsonl, og etter hver
+# bit av køen lagres et sjekkpunkt (lengden på JSONL-fila + røtter og dybde, så det
+# koster det samme uansett hvor stor crawlen er). En avbrutt crawl kan fortsette med
+# --resume: kø og seen spilles av fra JSONL-fila (se under). Til slutt komprimeres
+# JSONL-fila til crawl.json og tilstandsfila i samme format som før.
+PARTIAL_FP = Path(args.out).with_name(Path(args.out).stem + ".partial.jsonl")
+CHECKPOINT_FP = Path(args.out).with_name(Path(args.out).stem + ".checkpoint.json")
+CHUNK = max(4 * args.concurrency, 32)   # sider mellom sjekkpunkt
+
+# BFS: `seen` oppdateres når en URL legges i køen, så hver URL står der maks én gang
+# (med laveste dybde). Køen hentes i bølger parallelt, men resultatene behandles i
+# køens rekkefølge -> samme docs, dybder og rekkefølge som en sekvensiell BFS.
+# --max-pages er hentebudsjettet: nesten-duplikater teller, selv om de slås sammen.
+log = static_out.JsonlCheckpoint(PARTIAL_FP, CHECKPOINT_FP)
+run_sig = {"roots": roots, "maxDepth": args.max_depth}
+saved = log.open(resume=args.resume)
+if saved is not None and saved != run_sig:
+    print("Røtter/--max-depth er endret siden sjekkpunktet, starter på nytt")
+    saved = log.open(resume=False)
+
+dups = NearDupIndex(SIMHASH_MAX_DISTANCE)
+fetched = 0
+seen = set()
+frontier = deque()
+
+def enqueue(u: str, depth: int):
+    if allowed(u) and u not in seen:
+        seen.add(u)
+        frontier.append((u, depth))
+
+for r in roots:
+    enqueue(r, 0)
+
+if saved is not None:
+    # Avspilling: køen er FIFO, så hver side i loggen er den som står først i køen. Legges
+    # lenkene fra de skrevne sidene i kø igjen, blir seen og køen som ved sjekkpunktet.
+    for rec in log.records():
+        url, depth = frontier.popleft() if frontier else (None, None)
+        if url != rec["url"]:
+            print("Loggen stemmer ikke med køen, starter på nytt")
+            log.open(resume=False)
+            fetched, seen, frontier, dups = 0, set(), deque(), NearDupIndex(SIMHASH_MAX_DISTANCE)
+            for r in roots:
+                enqueue(r, 0)
+            break
+        fetched += 1
+        sh = (rec["entry"] or {}).get("simhash") if SIMHASH_MAX_DISTANCE >= 0 and rec["status"] != "error" else None
+        if rec["aliasOf"] is None:
+            if sh is not None:
+                dups.add(int(sh, 16), url)
+            if depth < args.max_depth:
+                for u in (rec["entry"] or {}).get("links") or []:
+                    enqueue(u, depth + 1)
+    else:
+        print(f"Fortsetter etter {fetched} sider, {len(frontier)} i køen")
+
+with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+    while frontier and fetched < args.max_pages:
+        batch = [frontier.popleft() for _ in range(min(len(frontier), args.max_pages - fetched, CHUNK))]
+        fetched += len(batch)
+        for (url, depth), (doc, links, entry, status) in zip(batch, pool.map(lambda job: crawl_one(*job), batch)):
+            # feilede sider har bare gammel tilstand: ingen nesten-duplikatsjekk
+            sh = entry.get("simhash") if entry and SIMHASH_MAX_DISTANCE >= 0 and status != "error" else None
+            canonical = dups.find(int(sh, 16)) if sh is not None else None
+            # samme innhold som en tidligere side: den beholdes og får aliaset ved
+            # komprimeringen; lenkene følges ikke (de er de samme)
+            log.append({"url": url, "status": status, "entry": entry, "aliasOf": canonical,
+                        "doc": doc if canonical is None else None})
+            if canonical is not None:
+                continue
+            if sh is not None:
+                dups.add(int(sh, 16), url)
+            if depth >= args.max_depth:
+                continue   # følg lenker videre kun inntil max-depth
+            for u in links:
+                enqueue(u, depth + 1)
+        log.checkpoint(run_sig)
+
+# Komprimering: JSONL -> crawl.json + tilstand. Første runde samler aliaser og tilstand,
+# andre strømmer dokumentene ut i opprinnelig rekkefølge.
+aliases = {}
+new_state = {}
+errors = []
+counts = {"not_modified": 0, "same_hash": 0, "parsed": 0, "error": 0, "duplicate": 0}
+for rec in log.records():
+    counts[rec["status"]] += 1
+    if rec["status"] == "error":
+        errors.append(rec["url"])
+    if rec["entry"] is not None:
+        new_state[rec["url"]] = rec["entry"]
+    if rec["aliasOf"] is not None:
+        aliases.setdefault(rec["aliasOf"], []).append(rec["url"])
+        counts["duplicate"] += 1
+
+def compacted_docs():
+    for rec in log.records():
+        doc = rec["doc"]
+        if doc is None:
+            continue
+        if doc["url"] in aliases:
+            doc["aliases"] = aliases[doc["url"]]
+        yield doc
+
+n_docs = static_out.write_json_array(args.out, compacted_docs())
 
-with open(args.out, "w", encoding="utf-8") as f:
-    json.dump(docs, f, ensure_ascii=False, indent=2)
+# Rapport mot forrige tilstand. Sider med hentefeil beholder forrige tilstand og
+# meldes under "errors", ikke som fjernet.
+added = [u for u in new_state if u not in prev_state]
+changed = [u for u, e in new_state.items() if u in prev_state and prev_state[u].get("hash") != e.get("hash")]
+removed = [u for u in prev_state if u not in new_state]
+report = {"added": added, "changed": changed, "removed": removed, "errors": errors}
+static_out.write_json(STATE_FP, {"version": STATE_VERSION, "pages": new_state, "report": report})
+log.finish()
 
-print(f"Crawled {len(docs)} pages (depth <= {args.max_depth}) → {args.out}")
+print(f"Crawled {fetched} pages → {n_docs} docs (depth <= {args.max_depth}) → {args.out}")
+print(f"  304: {counts['not_modified']}, same hash: {counts['same_hash']}, parsed: {counts['parsed']}, "
+      f"errors: {counts['error']}, near-duplicates: {counts['duplicate']}")
+for label, urls in (("added", added), ("changed", changed), ("removed", removed), ("errors", errors)):
+    print(f"  {label}: {len(urls)}" + "".join(f"\n    {u}" for u in urls[:20]) + ("\n    ..." if len(urls) > 20 else ""))
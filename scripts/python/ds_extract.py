@@ -0,0 +1,140 @@
+"""Feltuttrekk for crawl_ds.py: én lxml-traversering per side.
+
+Gir samme felt som den gamle BeautifulSoup-varianten (se legacy_extract i
+bench_crawl_parse.py), men uten å bygge et soup-tre og uten gjentatte select():
+én forhåndskompilert XPath henter alle interessante elementer i dokumentrekkefølge,
+og resten slås opp fra dem.
+"""
+import re
+import lxml.html
+from lxml import etree
+
+SECTION_HEADINGS = ["Tilgjengelighet", "Bruk", "Best practice", "God praksis", "Do", "Don't", "Obs", "Anbefalinger"]
+# én regex over små bokstaver = any(s.lower() in title.lower() for s in SECTION_HEADINGS)
+SECTION_HEADING_RE = re.compile("|".join(re.escape(s.lower()) for s in SECTION_HEADINGS))
+
+# Alt vi trenger, i dokumentrekkefølge. Første <p> er det samme som første treff på
+# "main p, article p, .content p, p" (select_one gir første element i dokumentet).
+ELEMENTS_XPATH = etree.XPath('//title | //meta[@name="description"] | //p | //h2 | //h3 | //a[@href]'
+                             ' | //main | //article | //*[@role="main"]')
+# get_text(" ", strip=True): tekstnoder utenom script/style/template (og ruby-annotasjoner
+# rt/rp, som bs4 også hopper over), strippet, tomme droppet
+TEXT_XPATH = etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template"
+                         " or ancestor::rt or ancestor::rp)]")
+LI_XPATH = etree.XPath(".//li")
+FALLBACK_TIPS_XPATHS = [
+    etree.XPath('//section[contains(@aria-labelledby, "tilgjeng")]//ul//li'),
+    etree.XPath('//section[contains(@aria-labelledby, "bruk")]//ul//li'),
+]
+
+
+def text_of(el) -> str:
+    return " ".join(s for s in (t.strip() for t in TEXT_XPATH(el)) if s)
+
+
+def classify_type(url: str) -> str:
+    ul = url.lower()
+    if "/designsystemet/komponenter/" in ul:
+        return "component"
+    if "/monster/" in ul:
+        return "pattern"
+    return "doc"
+
+
+def parse_html(html: str):
+    try:
+        return lxml.html.document_fromstring(html)
+    except ValueError:
+        # lxml godtar ikke str med <?xml encoding=...?>-deklarasjon
+        return lxml.html.document_fromstring(html.encode("utf-8"))
+    except etree.ParserError:
+        return None   # tom side
+
+
+def list_after(h):
+    """Første ul/ol blant søsknene etter overskriften, før neste h2/h3."""
+    sib = h.getnext()
+    while sib is not None:
+        if isinstance(sib.tag, str):   # hopp over kommentarer/PI
+            if sib.tag in ("ul", "ol"):
+                return sib
+            if sib.tag in ("h2", "h3"):
+                return None
+        sib = sib.getnext()
+    return None
+
+
+def extract_tips(headings, doc) -> list:
+    """Kuler/ol-li under seksjoner med relevante overskrifter (maks 8 per liste, 12 totalt)."""
+    tips = []
+    for h, title in headings:
+        if not SECTION_HEADING_RE.search(title.lower()):
+            continue
+        lst = list_after(h)
+        if lst is not None:
+            for li in LI_XPATH(lst)[:8]:
+                t = text_of(li)
+                if t:
+                    tips.append(t)
+    # fallbacks: lister inne i seksjoner som åpenbart er “tilgjengelighet” osv.
+    if not tips:
+        for xp in FALLBACK_TIPS_XPATHS:
+            for li in xp(doc)[:8]:
+                t = text_of(li)
+                if t:
+                    tips.append(t)
+    return tips[:12]
+
+
+def extract(url: str, html: str):
+    """-> (felt, brødtekst for SimHash, rå href-er i dokumentrekkefølge).
+
+    Brødteksten hentes bare fra hovedinnholdet (<main>, [role=main] eller <article>), ikke
+    felles header/meny/footer. Mangler det, er den None -> ingen nesten-duplikatsjekk.
+    """
+    doc = parse_html(html)
+    title_el = meta = first_p = main = role_main = article = None
+    headings, hrefs = [], []
+    for el in ELEMENTS_XPATH(doc) if doc is not None else ():
+        tag = el.tag
+        if tag == "a":
+            hrefs.append(el.get("href"))
+        elif tag in ("h2", "h3"):
+            headings.append((el, text_of(el)))
+        elif tag == "p":
+            if first_p is None:
+                first_p = el
+        elif tag == "title":
+            if title_el is None:
+                title_el = el
+        elif tag == "meta":
+            if meta is None:
+                meta = el
+        elif tag == "main":
+            if main is None:
+                main = el
+        elif tag == "article":
+            if article is None:
+                article = el
+        if role_main is None and el.get("role") == "main":
+            role_main = el
+
+    title = (title_el.text or "").strip() if title_el is not None else url
+    name = title.replace(" - Skatteetaten", "").strip() or title
+    # meta description først, ellers første avsnitt
+    if meta is not None and meta.get("content"):
+        summary = meta.get("content").strip()[:400]
+    elif first_p is not None:
+        summary = text_of(first_p)[:400]
+    else:
+        summary = ""
+    fields = {
+        "title": title,
+        "name": name,
+        "type": classify_type(url),
+        "summary": summary,
+        "tips": extract_tips(headings, doc) if doc is not None else [],
+        "anchors": [t for _, t in headings][:30],
+    }
+    scope = next((el for el in (main, role_main, article) if el is not None), None)
+    return fields, (text_of(scope) if scope is not None else None), hrefs
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""Søkestruktur for find-verktøyet, bygget av build_index.py og delt i shards.
+
+- postinglister: [docId, vekt, docId, vekt, ...] per term, sortert på docId.
+  Vekten er ferdig BM25F-skår: felt vektes (FIELD_WEIGHTS) og lengdenormaliseres
+  hver for seg, idf er ganget inn. Spørretid = summen av lengden på postinglistene
+  til termene i spørringen, ikke antall dokumenter.
+- normalisering ved bygging: termene er stammer (lett norsk stemming), sammensatte
+  ord indekseres også med delene, og alias-gruppene fra knowledge/aliases.no.json
+  er lagt inn i postingene. Nettleseren gjør ingen av delene: den slår opp ordformen
+  (alle ord fra teksten) eller en skjult variant (skrivemåter uten æøå, stammen selv).
+- term-shards, delt på prefiks (se partition): hvert har en prefiks-trie over sine
+  ordformer med komprimerte kanter ({kant: node, "$": term, "^": [[form, term], ...]
+  opptil TRIE_TOP, høyest df først}; løvnode = termen), de skjulte variantene og
+  postinglistene til termene sine. Gir oppslag, autoforslag og prefiks-utvidelse av
+  siste ord ved å hente ett shard.
+- trigram-shards (per første tegn som ikke er kantmarkøren, se gram_key): for
+  skrivefeil-tolerant oppslag når ingenting annet traff.
+
+Inkrementelt bygg: build() tar imot cachen fra forrige bygg og analyserer bare
+dokumenter med ny/endret tekst (se build).
+
+Manifestet (index.json -> "search") peker på filene; ShardedSearch.query() her er
+referansen, og find/app.js rangerer på samme måte.
+
+Bruk (referansesøk mot en ferdig index):
+  python scripts/python/search_index.py docs/find/index.json "neste knapp"
+"""
+import argparse, bisect, hashlib, json, math, re, sys
+from pathlib import Path
+
+TOKEN_RE = re.compile(r"[a-zæøå0-9]+")
+
+# title > name > keywords (manuelle aliaser/intensjoner) > anchors > summary;
+# "aliases" er ord fra knowledge/aliases.no.json som dokumentet fikk via en alias-gruppe
+FIELD_WEIGHTS = {"title": 3.0, "name": 2.5, "keywords": 2.0, "anchors": 1.5, "summary": 1.0, "aliases": 1.0}
+K1 = 1.2
+B = 0.75
+TRIE_TOP = 8          # ordformer per trie-node for forslag/prefiks-utvidelse
+PREFIX_FACTOR = 0.5   # prefiks-treff på siste ord teller halvt
+FUZZY_MIN_LEN = 4     # kortere ord slås ikke opp fuzzy
+FUZZY_MIN = 0.5       # minste Dice-likhet (trigram) for et fuzzy-treff
+FUZZY_TOP = 3         # maks antall ordformer et feilstavet ord utvides til
+FUZZY_FACTOR = 0.5    # fuzzy-treff teller likhet x dette
+WEIGHT_DIGITS = 4
+SHARD_BYTES = 16 * 1024   # omtrentlig maks størrelse på et term-shard før det deles videre
+
+# ---------- norsk normalisering (kjøres bare ved bygging) ----------
+# Lett bokmålsstemmer: fjern bøyingsendelser, lengste først, inntil to ganger
+# (skjemaene -> skjema -> skjem), men la minst MIN_STEM tegn stå igjen.
+STEM_SUFFIXES = sorted(["hetene", "hetens", "heten", "heter", "endes", "ende", "ene", "ane",
+                        "ens", "ers", "ets", "het", "en", "ar", "er", "et", "a", "e"], key=len, reverse=True)
+MIN_STEM = 3
+# Sammensatte ord deles i kjente ord fra korpuset (>= MIN_PART tegn), ev. med fugebokstav
+MIN_PART = 4
+LINKS = ("", "s", "e")
+# Skrivemåter uten æøå, som søket også skal kjenne igjen
+TRANSLIT = [str.maketrans({"æ": "ae", "ø": "oe", "å": "aa"}), str.maketrans({"æ": "ae", "ø": "o", "å": "a"})]
+
+
+def toks(s):
+    return TOKEN_RE.findall((s or "").lower())
+
+
+def stem(word):
+    if not word.isalpha():
+        return word
+    for _ in range(2):
+        for suf in STEM_SUFFIXES:
+            if word.endswith(suf) and len(word) - len(suf) >= MIN_STEM:
+                word = word[:-len(suf)]
+                break
+        else:
+            break
+    return word
+
+
+def split_compound(word, known):
+    """['skjema', 'design'] for 'skjemadesign' hvis delene finnes i `known`, ellers []."""
+    if len(word) < 2 * MIN_PART:
+        return []
+    for i in range(len(word) - MIN_PART, MIN_PART - 1, -1):   # lengste forledd først
+        head, tail = word[:i], word[i:]
+        for link in LINKS:
+            if link and not head.endswith(link):
+                continue
+            h = head[:len(head) - len(link)]
+            if len(h) < MIN_PART or h not in known:
+                continue
+            if tail in known:
+                return [h, tail]
+            rest = split_compound(tail, known)
+            if rest:
+                return [h] + rest
+    return []
+
+
+def variants(form):
+    if not any(c in form for c in "æøå"):
+        return []
+    return list(dict.fromkeys(v for v in (form.translate(t) for t in TRANSLIT) if v != form))
+
+
+def grams(word):
+    """Trigrammer av ordet med mellomrom som kantmarkør."""
+    w = f" {word} "
+    return sorted({w[i:i + 3] for i in range(len(w) - 2)})
+
+
+def gram_key(gram):
+    """Trigram-shardet et trigram ligger i: første tegn utenom kantmarkøren
+    (ellers ville " xy"-trigrammene til alle ord havnet i samme shard)."""
+    return gram.strip()[0]
+
+
+def doc_fields(d):
+    """Ordene (overflateform) i tekstfeltene som indekseres for et dokument."""
+    return {
+        "title": toks(d.get("title")),
+        "name": toks(d.get("name")),
+        "keywords": [t for k in d.get("keywords") or [] for t in toks(k)],
+        "anchors": [t for a in d.get("anchors") or [] for t in toks(a)],
+        "summary": toks(d.get("summary")),
+    }
+
+
+def contains(seq, phrase):
+    n = len(phrase)
+    return n > 0 and any(seq[i:i + n] == phrase for i in range(len(seq) - n + 1))
+
+
+def content_hash(obj):
+    return hashlib.sha1(json.dumps(obj, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def analysis_version():
+    """Endres denne fila (stemmer, oppdeling, vekter ...), er hele byggecachen ugyldig."""
+    return content_hash(Path(__file__).read_text(encoding="utf-8"))[:12]
+
+
+def substrings(word):
+    """Alle delstrenger på minst MIN_PART tegn: det eneste split_compound slår opp i `known`."""
+    return {word[i:j] for i in range(len(word)) for j in range(i + MIN_PART, len(word) + 1)}
+
+
+def analyze(fields, known):
+    """Overflateord per felt -> termer per felt (stammer + stammene til delene av sammensatte ord)."""
+    out = {}
+    for f, ws in fields.items():
+        terms = []
+        for w in ws:
+            terms.append(stem(w))
+            terms += [stem(p) for p in split_compound(w, known)]
+        out[f] = terms
+    return out
+
+
+def match_aliases(terms, groups):
+    """Finnes én frase fra en alias-gruppe i et felt, får dokumentet de andre frasene.
+    -> (termer til "aliases"-feltet, ordformene deres)"""
+    extra, forms = [], []
+    for g in groups:
+        hit = [i for i, (_, st) in enumerate(g) if any(contains(ts, st) for ts in terms.values())]
+        if hit:
+            for i, (ws, st) in enumerate(g):
+                if i not in hit:
+                    extra += st
+                    forms += ws
+    return extra, forms
+
+
+def build(docs, aliases=None, cache=None):
+    """`docs`: [(docId, dict)], `aliases`: {frase: [synonymer]}, `cache`: fra forrige bygg
+    -> (korpus for shard(), ny cache, endringer).
+
+    Korpus: {"postings": {term: [docId, vekt, ...]}, "df": {term: n}, "forms": {form: term},
+             "variants": {skjult form: term}}
+
+    Analysen av et dokument (stammer, sammensatte ord, alias-treff) caches på innholdshashen
+    til tekstfeltene og gjenbrukes så lenge den ikke kan ha endret seg: samme analysis_version(),
+    samme alias-fil, og ingen nye/fjernede ord i korpuset er delstreng av et av ordene (da kan
+    oppdelingen av sammensatte ord bli en annen). BM25-vektene avhenger av hele korpuset
+    (antall dokumenter, snittlengder, df) og regnes alltid ut på nytt fra de lagrede termene;
+    det er ren aritmetikk.
+    """
+    version = analysis_version()
+    if not isinstance(cache, dict) or cache.get("version") != version:
+        cache = {}
+    prev_docs = cache.get("docs") or {}
+
+    surface = [(doc_id, doc_fields(d)) for doc_id, d in docs]
+    hashes = [content_hash(fs) for _, fs in surface]
+    known = {w for _, fs in surface for ws in fs.values() for w in ws if len(w) >= MIN_PART}
+
+    # ord i gjenbrukte dokumenter som kan deles annerledes nå
+    resplit = set()
+    delta = known ^ set(cache.get("known") or ()) if prev_docs else set()
+    if delta:
+        for (_, fs), h in zip(surface, hashes):
+            if h in prev_docs:
+                resplit.update(w for ws in fs.values() for w in ws
+                               if len(w) >= 2 * MIN_PART and not delta.isdisjoint(substrings(w)))
+
+    alias_hash = content_hash(aliases or {})
+    groups = [[key] + list(vals) for key, vals in (aliases or {}).items()]
+    groups = [[(toks(ph), [stem(w) for w in toks(ph)]) for ph in g] for g in groups]
+    same_aliases = bool(prev_docs) and cache.get("aliases") == alias_hash
+
+    entries, analyzed, rematched = {}, 0, 0
+    for (_, fs), h in zip(surface, hashes):
+        if h in entries:
+            continue
+        entry = prev_docs.get(h)
+        if entry is None or any(w in resplit for ws in fs.values() for w in ws):
+            entry = {"terms": analyze(fs, known)}
+            analyzed += 1
+        elif not same_aliases:
+            entry = dict(entry)
+            rematched += 1
+        else:
+            entries[h] = entry
+            continue
+        entry["aliases"], entry["aliasForms"] = match_aliases(entry["terms"], groups)
+        entries[h] = entry
+
+    analyzed_docs = [(doc_id, {**entries[h]["terms"], "aliases": entries[h]["aliases"]})
+                     for (doc_id, _), h in zip(surface, hashes)]
+    forms = {w for _, fs in surface for ws in fs.values() for w in ws}
+    forms.update(w for e in entries.values() for w in e["aliasForms"])
+
+    n = len(analyzed_docs)
+    avg_len = {f: (sum(len(fs[f]) for _, fs in analyzed_docs) / n if n else 0) or 1 for f in FIELD_WEIGHTS}
+
+    # vektet, lengdenormalisert tf per (term, doc)
+    tfw = {}
+    for doc_id, fs in analyzed_docs:
+        for f, weight in FIELD_WEIGHTS.items():
+            terms = fs[f]
+            if not terms:
+                continue
+            norm = 1 - B + B * len(terms) / avg_len[f]
+            for t in terms:
+                per_doc = tfw.setdefault(t, {})
+                per_doc[doc_id] = per_doc.get(doc_id, 0.0) + weight / norm
+
+    terms = sorted(tfw)
+    postings, df = {}, {}
+    for t in terms:
+        per_doc = tfw[t]
+        idf = math.log(1 + (n - len(per_doc) + 0.5) / (len(per_doc) + 0.5))
+        flat = []
+        for doc_id in sorted(per_doc):
+            tf = per_doc[doc_id]
+            flat += [doc_id, round(idf * tf / (K1 + tf), WEIGHT_DIGITS)]
+        df[t] = len(per_doc)
+        postings[t] = flat
+
+    # ordformer (slik de står i teksten) -> term; spørringen slås opp her, uten stemming i nettleseren
+    form_term = {f: stem(f) for f in sorted(forms) if stem(f) in postings}
+    # skjulte oppslagsformer: skrivemåter uten æøå, og stammen selv ("knapp" -> knapper/knappen)
+    variant_term = {}
+    for f, t in form_term.items():
+        for v in variants(f) + [t]:
+            if v not in form_term and v not in variant_term:
+                variant_term[v] = t
+
+    corpus = {"postings": postings, "df": df, "forms": form_term, "variants": variant_term}
+    new_cache = {"version": version, "aliases": alias_hash, "known": sorted(known), "docs": entries}
+    changes = {"analyzed": analyzed, "rematched": rematched, "reused": len(entries) - analyzed - rematched,
+               "resplit": len(resplit), "aliasesChanged": bool(prev_docs) and not same_aliases}
+    return corpus, new_cache, changes
+
+
+# ---------- oppdeling i shards ----------
+def partition(items, key="", limit=SHARD_BYTES):
+    """[(ord, bytes)] -> {prefiks: [ord]}. En shard over `limit` deles på neste tegn;
+    ord som er like lange som prefikset blir igjen i den. Alle mellomnivåer beholdes
+    (de har "^"-lista for sitt prefiks), så ethvert ord hører til det lengste prefikset."""
+    longer = [(w, b) for w, b in items if len(w) > len(key)]
+    if sum(b for _, b in items) <= limit or not longer:
+        return {key: [w for w, _ in items]}
+    out = {key: [w for w, _ in items if len(w) == len(key)]}
+    groups = {}
+    for w, b in longer:
+        groups.setdefault(w[len(key)], []).append((w, b))
+    for c in sorted(groups):
+        out.update(partition(groups[c], key + c, limit))
+    return out
+
+
+def top_forms(forms, rank):
+    return sorted(forms, key=lambda f: (-rank[f], f))[:TRIE_TOP]
+
+
+def build_trie(key, words, form_term, rank, root_top):
+    """Komprimert prefiks-trie (radix) over `words` (alle starter med `key`, kantene er
+    resten). Node: {kant: node, "$": term, "^": [[form, term], ...]}; løvnode = termen.
+    Rota får `root_top` (beste former med prefikset i hele korpuset, også i dypere shards)."""
+    root = {}
+    for w in words:
+        node, rest = root, w[len(key):]
+        while rest:
+            edge = next((e for e in node if e not in ("$", "^") and e[0] == rest[0]), None)
+            if edge is None:
+                node[rest] = {}
+                node, rest = node[rest], ""
+                break
+            common = 0
+            while common < min(len(edge), len(rest)) and edge[common] == rest[common]:
+                common += 1
+            if common < len(edge):
+                # del kanten: edge = felles + resten
+                child = node.pop(edge)
+                node[edge[:common]] = {edge[common:]: child}
+                edge = edge[:common]
+            node, rest = node[edge], rest[common:]
+        node["$"] = form_term[w]
+
+    def fill(node, prefix):
+        found = [prefix] if "$" in node else []
+        for e in [e for e in node if e != "$"]:
+            child = node[e]
+            if list(child) == ["$"]:
+                node[e] = child["$"]   # løvnode -> bare termen
+                found.append(prefix + e)
+            else:
+                found += fill(child, prefix + e)
+        node["^"] = [[f, form_term[f]] for f in top_forms(found, rank)]
+        return found
+
+    fill(root, key)
+    root["^"] = [[f, form_term[f]] for f in root_top]
+    return root
+
+
+def shard(corpus):
+    """Del korpuset i shards som lastes ved behov.
+
+    -> (term-shards {prefiks: {"trie", "variants", "postings"}},
+        trigram-shards {gram_key: {"forms": [[form, term]], "grams": {trigram: [indeks]}}})
+    Et ord (form, skjult variant eller term) ligger i shardet for det lengste prefikset
+    som finnes; siste ord i spørringen og termene det gir treffer som regel samme shard.
+    """
+    postings, forms, variant_term = corpus["postings"], corpus["forms"], corpus["variants"]
+    rank = {f: corpus["df"][t] for f, t in forms.items()}
+    size = {}
+    for f, t in forms.items():
+        size[f] = size.get(f, 0) + len(f) + len(t) + 8
+    for v, t in variant_term.items():
+        size[v] = size.get(v, 0) + len(v) + len(t) + 6
+    for t, p in postings.items():
+        size[t] = size.get(t, 0) + len(t) + len(json.dumps(p, separators=(",", ":"))) + 4
+    keys = partition(sorted(size.items()))
+
+    sorted_forms = sorted(forms)
+    term_shards = {}
+    for key, words in keys.items():
+        words = set(words)
+        # beste former med prefikset i hele korpuset (sortert liste -> sammenhengende område)
+        lo = bisect.bisect_left(sorted_forms, key)
+        hi = bisect.bisect_left(sorted_forms, key + "\uffff")
+        term_shards[key] = {
+            "trie": build_trie(key, sorted(w for w in words if w in forms), forms, rank,
+                               top_forms(sorted_forms[lo:hi], rank)),
+            "variants": {v: variant_term[v] for v in sorted(words) if v in variant_term},
+            "postings": {t: postings[t] for t in sorted(words) if t in postings},
+        }
+
+    gram_shards = {}
+    for f in sorted_forms:
+        for g in grams(f):
+            sh = gram_shards.setdefault(gram_key(g), {"forms": [], "grams": {}, "_idx": {}})
+            if f not in sh["_idx"]:
+                sh["_idx"][f] = len(sh["forms"])
+                sh["forms"].append([f, forms[f]])
+            sh["grams"].setdefault(g, []).append(sh["_idx"][f])
+    for sh in gram_shards.values():
+        del sh["_idx"]
+        sh["grams"] = dict(sorted(sh["grams"].items()))
+    return term_shards, gram_shards
+
+
+def params():
+    return {"k1": K1, "b": B, "fields": FIELD_WEIGHTS, "prefixFactor": PREFIX_FACTOR,
+            "fuzzy": {"minLen": FUZZY_MIN_LEN, "min": FUZZY_MIN, "top": FUZZY_TOP, "factor": FUZZY_FACTOR}}
+
+
+# ---------- spørring (referanse for find/app.js) ----------
+def trie_walk(node, rest, path):
+    """Gå `rest` ned fra `node` (som står for `path`) -> (node, form, eksakt).
+
+    form er hele ordet frem til noden (for løvnoder: hele formen); eksakt er False
+    hvis `rest` sluttet midt på en kant. (None, None, False) hvis ingenting starter slik."""
+    while rest:
+        if isinstance(node, str):
+            return None, None, False
+        edge = next((e for e in node if e not in ("$", "^") and e[0] == rest[0]), None)
+        if edge is None:
+            return None, None, False
+        if rest.startswith(edge):
+            node, path, rest = node[edge], path + edge, rest[len(edge):]
+        elif edge.startswith(rest):
+            return node[edge], path + edge, False   # prefikset slutter midt på kanten
+        else:
+            return None, None, False
+    return node, path, True
+
+
+def node_top(node, form):
+    """[[form, term], ...] under en trie-node, høyest df først."""
+    return [[form, node]] if isinstance(node, str) else node["^"]
+
+
+class ShardedSearch:
+    """Søk mot manifestet (index.json -> "search") med shards hentet via `load(fil)`."""
+
+    def __init__(self, search, load):
+        self.s = search
+        self.load = load
+        self.cache = {}
+
+    def _file(self, name):
+        if name not in self.cache:
+            self.cache[name] = self.load(name)
+        return self.cache[name]
+
+    def shard(self, word):
+        """-> (prefiks, shard) for det lengste shard-prefikset av `word`."""
+        keys = self.s["terms"]
+        for i in range(len(word), -1, -1):
+            if word[:i] in keys:
+                return word[:i], self._file(keys[word[:i]])
+        raise KeyError(word)
+
+    def postings(self, term):
+        return self.shard(term)[1]["postings"].get(term, [])
+
+    def suggest(self, prefix):
+        key, sh = self.shard(prefix)
+        node, form, _ = trie_walk(sh["trie"], prefix[len(key):], key)
+        return [f for f, _ in node_top(node, form)] if node is not None else []
+
+    def fuzzy(self, word):
+        """Termer for ordformer som ligner `word` (Dice over trigrammer) -> [(term, likhet)]."""
+        g = grams(word)
+        shared = {}
+        for gram in g:
+            name = self.s["grams"].get(gram_key(gram))
+            if name is None:
+                continue
+            sh = self._file(name)
+            for i in sh["grams"].get(gram, ()):
+                f = tuple(sh["forms"][i])
+                shared[f] = shared.get(f, 0) + 1
+        scored = [(f, t, 2 * c / (len(g) + len(grams(f)))) for (f, t), c in shared.items()]
+        scored = [x for x in scored if x[2] >= self.s["fuzzy"]["min"]]
+        scored.sort(key=lambda x: (-x[2], x[0]))
+        return [(t, sim) for _, t, sim in scored[:self.s["fuzzy"]["top"]]]
+
+    def expand(self, word, last):
+        """Termene et ord i spørringen slår opp -> {term: faktor}.
+
+        Ordformen selv (eller en skrivemåte uten æøå / stammen) gir faktor 1. Siste ord kan være
+        halvskrevet og utvides også til de hyppigste ordformene med det som prefiks.
+        Finnes ingenting, prøves fuzzy-oppslag (skrivefeil).
+        """
+        key, sh = self.shard(word)
+        node, form, exact = trie_walk(sh["trie"], word[len(key):], key)
+        out = {}
+        term = None
+        if node is not None and exact:
+            term = node if isinstance(node, str) else node.get("$")
+        if term is None:
+            term = sh["variants"].get(word)
+        if term is not None:
+            out[term] = 1.0
+        if last and node is not None:
+            for _, t in node_top(node, form):
+                out.setdefault(t, self.s["prefixFactor"])
+        if not out and len(word) >= self.s["fuzzy"]["minLen"]:
+            for t, sim in self.fuzzy(word):
+                out[t] = max(out.get(t, 0), sim * self.s["fuzzy"]["factor"])
+        return out
+
+    def query(self, q, limit=None):
+        """Rangerte treff [(docId, skår)]: skår synkende, så docId stigende.
+
+        Hvert ord bidrar med vekten fra postinglistene til termene det utvides til
+        (se expand); per ord teller beste treff per dokument.
+        """
+        words = list(dict.fromkeys(toks(q)))
+        scores = {}
+        for pos, w in enumerate(words):
+            best = {}
+            for term, factor in self.expand(w, pos == len(words) - 1).items():
+                p = self.postings(term)
+                for j in range(0, len(p), 2):
+                    s = p[j + 1] * factor
+                    if s > best.get(p[j], 0):
+                        best[p[j]] = s
+            for doc_id, s in best.items():
+                scores[doc_id] = scores.get(doc_id, 0) + s
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return ranked[:limit] if limit else ranked
+
+
+def open_index(path):
+    """index.json (manifest) -> (manifest, ShardedSearch, doc(id)) med filer fra samme katalog."""
+    base = Path(path).parent
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    load = lambda name: json.loads((base / name).read_text(encoding="utf-8"))
+    search = ShardedSearch(manifest["search"], load)
+    chunks = manifest["docs"]
+
+    def doc(doc_id):
+        return search._file(chunks["files"][doc_id // chunks["chunkSize"]])[doc_id % chunks["chunkSize"]]
+    return manifest, search, doc
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("index")
+    ap.add_argument("query")
+    ap.add_argument("--limit", type=int, default=10)
+    args = ap.parse_args()
+
+    _, search, doc = open_index(args.index)
+    for doc_id, score in search.query(args.query, args.limit):
+        d = doc(doc_id)
+        print(f"{score:8.4f}  {d.get('type', ''):9}  {d.get('name') or d.get('title')}  {d.get('url') or ''}")
+    words = toks(args.query)
+    if words:
+        print("forslag:", ", ".join(search.suggest(words[-1])), file=sys.stderr)
+    print(f"lastet {len(search.cache)} filer", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
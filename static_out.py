@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Felles skriver for statiske artefakter (JSON/CSV som sidene henter).
+
+- minifisert JSON (ingen innrykk)
+- atomisk: skriv til en temp-fil i samme katalog og os.replace, så en kjøring
+  som krasjer aldri etterlater en halvskrevet fil
+- compress=True: forhåndskomprimerte søsken med innholdshash i navnet
+  (<navn>.<hash>.json.gz / .br) og artifacts.json i samme katalog. Sidene slår
+  opp der og henter den hashede filen, som kan caches lenge (se _headers).
+  Forrige generasjon beholdes, så en side som nettopp leste manifestet ikke får 404.
+
+JsonlCheckpoint: append-only JSONL + sjekkpunkt for lange kjøringer som skal
+kunne gjenopptas (--resume) etter krasj/timeout.
+
+brotli er valgfritt; uten pakken skrives bare .gz.
+"""
+import gzip, hashlib, json, os, re, tempfile
+from contextlib import contextmanager
+from pathlib import Path
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_NAME = "artifacts.json"
+HASH_LEN = 10
+
+
+@contextmanager
+def atomic_open(path):
+    """Binær filhandle som først blir til `path` når blokken fullføres uten feil."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_bytes(path, data: bytes):
+    with atomic_open(path) as f:
+        f.write(data)
+
+
+def atomic_write_text(path, text: str, encoding="utf-8"):
+    atomic_write_bytes(path, text.encode(encoding))
+
+
+def dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_json(path, obj, compress=False):
+    """Skriv `obj` minifisert og atomisk til `path` (+ komprimerte søsken)."""
+    data = dumps(obj)
+    atomic_write_bytes(path, data)
+    if compress:
+        publish_compressed(path, data)
+    return len(data)
+
+
+def write_json_array(path, items):
+    """Som write_json(path, list(items)), men strømmer elementene rett til fila."""
+    n = 0
+    with atomic_open(path) as f:
+        f.write(b"[")
+        for item in items:
+            f.write(b"," + dumps(item) if n else dumps(item))
+            n += 1
+        f.write(b"]")
+    return n
+
+
+def _load_manifest(fp: Path):
+    try:
+        m = json.loads(fp.read_text(encoding="utf-8"))
+        return m if isinstance(m, dict) else {}
+    except Exception:
+        return {}
+
+
+def publish_compressed(path, data: bytes):
+    """Skriv <stem>.<hash><suffix>.gz/.br ved siden av `path` og oppdater artifacts.json."""
+    path = Path(path)
+    digest = hashlib.sha256(data).hexdigest()
+    stem, suffix = path.stem, path.suffix
+    variants = {"gz": lambda: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = lambda: brotli.compress(data, quality=11)
+
+    entry = {"sha256": digest, "bytes": len(data)}
+    for ext, make in variants.items():
+        name = f"{stem}.{digest[:HASH_LEN]}{suffix}.{ext}"
+        fp = path.parent / name
+        if not fp.exists():
+            atomic_write_bytes(fp, make())
+        entry[ext] = name
+        entry[ext + "Bytes"] = fp.stat().st_size
+
+    mf = path.parent / MANIFEST_NAME
+    manifest = _load_manifest(mf)
+    prev = manifest.get(path.name) or {}
+    if prev.get("sha256") == digest:
+        entry["previous"] = prev.get("previous")
+    elif prev:
+        entry["previous"] = {ext: prev[ext] for ext in ("gz", "br") if prev.get(ext)}
+    if not entry.get("previous"):
+        entry.pop("previous", None)
+    manifest[path.name] = entry
+    atomic_write_bytes(mf, json.dumps(dict(sorted(manifest.items())), ensure_ascii=False, indent=2).encode("utf-8"))
+
+    # rydd eldre generasjoner (alt utenom gjeldende og forrige)
+    keep = {entry.get(ext) for ext in variants} | set((entry.get("previous") or {}).values())
+    pat = re.compile(re.escape(stem) + r"\.[0-9a-f]{%d}" % HASH_LEN + re.escape(suffix) + r"\.(?:gz|br)$")
+    for fp in path.parent.iterdir():
+        if pat.match(fp.name) and fp.name not in keep:
+            fp.unlink(missing_ok=True)
+    return entry
+
+
+class JsonlCheckpoint:
+    """Append-only JSONL med sjekkpunkt.
+
+    Hver post skrives som én linje med en gang den er klar. checkpoint(state)
+    lagrer kallerens tilstand (kø, markør, ...) sammen med hvor lang JSONL-filen
+    var da. open(resume=True) kutter alt etter den lengden (halvskrevne linjer
+    fra en krasj) og returnerer tilstanden; uten sjekkpunkt startes det på nytt.
+    """
+
+    def __init__(self, jsonl_path, checkpoint_path):
+        self.path = Path(jsonl_path)
+        self.ckpt = Path(checkpoint_path)
+        self.fh = None
+
+    def open(self, resume=False):
+        saved = None
+        if resume:
+            try:
+                saved = json.loads(self.ckpt.read_text(encoding="utf-8"))
+                if not self.path.exists() or self.path.stat().st_size < saved["bytes"]:
+                    saved = None   # JSONL mangler/er kortere enn sjekkpunktet: ubrukelig
+            except Exception:
+                saved = None
+        if self.fh is not None:
+            self.fh.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fh = self.path.open("ab" if saved else "wb")
+        if saved:
+            self.fh.truncate(saved["bytes"])
+            self.fh.seek(0, os.SEEK_END)
+        return saved["state"] if saved else None
+
+    def append(self, obj):
+        self.fh.write(dumps(obj) + b"\n")
+
+    def checkpoint(self, state):
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        atomic_write_bytes(self.ckpt, dumps({"bytes": self.fh.tell(), "state": state}))
+
+    def records(self):
+        """Alle poster så langt, i skriverekkefølge (leses fra disk, ikke minnet)."""
+        self.fh.flush()
+        with self.path.open("rb") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def finish(self):
+        """Kjøringen er komprimert til endelig format: fjern JSONL og sjekkpunkt."""
+        self.fh.close()
+        self.path.unlink(missing_ok=True)
+        self.ckpt.unlink(missing_ok=True)
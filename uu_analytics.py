@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""Vektorisert analyse over UU-arkivet (latest.json + segmentert endringslogg).
+
+Dagens tilstand lastes som en tett bool-matrise entry x WCAG-krav (kolonner i
+samme rekkefølge som build_uu_archive.WCAG_SC). Endringsloggen gjøres om til en
+hendelsestabell (entry, krav, dag, verdi), og alt videre regnes med numpy:
+
+  - samforekomst mellom krav                       (X.T @ X)
+  - etterlevelseskurver per domene                 (andel entries med 0 brudd per dag)
+  - median tid til utbedring per krav              (dager fra bruddet dukker opp til det forsvinner)
+  - uke-over-uke-endring i antall brudd per krav
+
+Bruk:
+  python uu_analytics.py                           # skriv sammendrag
+  python uu_analytics.py --out docs/data/uustatus/analytics.json
+  python uu_analytics.py --weeks 26 --top 20
+
+Koder utenfor WCAG_SC (ncExtra) tas ikke med i matrisene.
+"""
+import argparse, json, sys, time
+from pathlib import Path
+import build_uu_archive as arch
+import static_out
+try:
+    import numpy as np
+except Exception:
+    print("Missing deps. Make sure numpy is installed.", file=sys.stderr)
+    sys.exit(1)
+
+N_SC = len(arch.WCAG_SC)
+N_WORDS = (N_SC + 63) // 64
+_SHIFTS = np.arange(64, dtype=np.uint64)
+_WORD = (1 << 64) - 1
+
+KIND_CHANGE, KIND_NEW, KIND_REMOVED = 0, 1, 2
+
+
+def masks_to_matrix(masks):
+    """Heltalls-bitmasker (som i latest.json) -> bool-matrise len(masks) x N_SC."""
+    n = len(masks)
+    words = [np.fromiter(((m >> (64 * w)) & _WORD for m in masks), dtype=np.uint64, count=n)
+             for w in range(N_WORDS)]
+    bits = np.concatenate([(wd[:, None] >> _SHIFTS) & np.uint64(1) for wd in words], axis=1)
+    return bits[:, :N_SC].astype(bool)
+
+
+# ---------- innlasting ----------
+def load_current():
+    """latest.json -> (keys, domains, X) der X er bool-matrisen entry x krav."""
+    obj = arch.load_json(arch.LATEST_JSON, fallback={"urls": []}) or {}
+    rows = obj.get("urls", []) if isinstance(obj, dict) else obj
+    keys, domains, masks = [], [], []
+    for raw in rows:
+        if not isinstance(raw, dict):
+            continue
+        k = arch.make_key(raw)
+        if not k:
+            continue
+        if "ncMask" in raw:
+            mask = int(raw["ncMask"] or "0", 16)
+        else:
+            mask = arch.codes_to_bits(raw.get("nonConformities") or [])[0]
+        keys.append(k)
+        domains.append(raw.get("domain") or arch.to_domain(raw.get("url") or ""))
+        masks.append(mask)
+    return keys, domains, masks_to_matrix(masks)
+
+
+def iter_changes():
+    """Alle rader i endringsloggen i kronologisk rekkefølge (segmenter, ellers gammel fil)."""
+    manifest, _ = arch.load_changelog()
+    files = [arch.LOGS_DIR / s["file"] for s in manifest["segments"]]
+    if not files and arch.CHANGES_LOG.exists():
+        files = [arch.CHANGES_LOG]
+    for fp in files:
+        with fp.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+class Events:
+    """Endringsloggen som numpy-arrays.
+
+    Rader:     row_entry, row_day, row_kind  (én per loggrad)
+    Hendelser: ev_row, ev_code, ev_val       (krav satt til 1/0 av en rad)
+
+    newEntry/removedEntry oppgir hele tilstanden. De lagres ikke som nuller for
+    alle krav (gjentatte "initial snapshot"-rader ville gitt N x 87 hendelser per
+    kjøring), men starter en ny epoke for entryen: se intervals().
+    """
+
+    def __init__(self, rows):
+        entry_ids, dom_ids = {}, {}
+        self.entry_domain = []
+        row_entry, row_day, row_kind = [], [], []
+        ev_row, ev_code, ev_val = [], [], []
+        bit = arch.WCAG_BIT
+
+        for ch in rows:
+            url = (ch.get("url") or "").strip()
+            day = (ch.get("detectedDate") or ch.get("ts") or "")[:10]
+            if not url or not day:
+                continue
+            key = "url::" + arch.canon_url(url)
+            e = entry_ids.get(key)
+            if e is None:
+                e = entry_ids[key] = len(entry_ids)
+                dom = ch.get("domain") or arch.to_domain(url)
+                self.entry_domain.append(dom_ids.setdefault(dom, len(dom_ids)))
+            changed = ch.get("changed") or {}
+            kind = KIND_NEW if changed.get("newEntry") else KIND_REMOVED if changed.get("removedEntry") else KIND_CHANGE
+            r = len(row_entry)
+            row_entry.append(e)
+            row_day.append(day)
+            row_kind.append(kind)
+
+            for code in ch.get("added") or ():
+                b = bit.get(code)
+                if b is not None:
+                    ev_row.append(r); ev_code.append(b); ev_val.append(1)
+            if kind == KIND_CHANGE:
+                for code in ch.get("removed") or ():
+                    b = bit.get(code)
+                    if b is not None:
+                        ev_row.append(r); ev_code.append(b); ev_val.append(0)
+
+        self.keys = list(entry_ids)
+        self.domains = list(dom_ids)
+        self.entry_domain = np.array(self.entry_domain, dtype=np.int64)
+        self.row_entry = np.array(row_entry, dtype=np.int64)
+        self.row_kind = np.array(row_kind, dtype=np.int8)
+        days = np.array(row_day, dtype="datetime64[D]")
+        self.day0 = days.min() if len(days) else np.datetime64("today", "D")
+        self.row_day = (days - self.day0).astype(np.int64)
+        self.n_days = int(self.row_day.max()) + 1 if len(days) else 0
+
+        self.ev_row = np.array(ev_row, dtype=np.int64)
+        self.ev_code = np.array(ev_code, dtype=np.int64)
+        self.ev_val = np.array(ev_val, dtype=np.int8)
+
+    @property
+    def n_entries(self):
+        return len(self.keys)
+
+    def dates(self, idx=None):
+        d = self.day0 + np.arange(self.n_days) if idx is None else self.day0 + np.asarray(idx)
+        return [str(x) for x in d]
+
+    def intervals(self):
+        """Perioder der et krav er brutt: (entry, code, start, end, closed, fixed).
+
+        1. Hver newEntry/removedEntry-rad starter en ny epoke for entryen, der
+           alle krav er 0 til de settes.
+        2. Innen (entry, epoke, krav) fjernes hendelser som ikke endrer verdien;
+           hver 1-hendelse åpner en periode som lukkes av neste hendelse, ellers
+           av starten på neste epoke (eller er åpen).
+        3. Perioder som lukkes av en epokestart der kravet settes igjen i samme
+           rad, slås sammen med fortsettelsen.
+        `fixed` er lukkede perioder der raden som lukket ikke var removedEntry.
+        """
+        n_rows = len(self.row_entry) + 1
+        ent = self.row_entry[self.ev_row]
+
+        resets = np.flatnonzero(self.row_kind != KIND_CHANGE)
+        rkey = np.sort(self.row_entry[resets] * n_rows + resets)
+        epoch = np.searchsorted(rkey, ent * n_rows + self.ev_row, side="right")
+
+        order = np.lexsort((self.ev_row, self.ev_code, epoch, ent))
+        ent, epoch, code = ent[order], epoch[order], self.ev_code[order]
+        val, row = self.ev_val[order], self.ev_row[order]
+        new_group = np.ones(len(ent), dtype=bool)
+        new_group[1:] = (ent[1:] != ent[:-1]) | (epoch[1:] != epoch[:-1]) | (code[1:] != code[:-1])
+
+        keep = new_group.copy()
+        keep[1:] |= val[1:] != val[:-1]
+        keep &= ~(new_group & (val == 0))   # 0 først i epoken: ingenting å lukke
+        ent, epoch, code, val, row = ent[keep], epoch[keep], code[keep], val[keep], row[keep]
+        new_group = np.ones(len(ent), dtype=bool)
+        new_group[1:] = (ent[1:] != ent[:-1]) | (epoch[1:] != epoch[:-1]) | (code[1:] != code[:-1])
+
+        # lukking: neste hendelse i samme gruppe, ellers neste epokestart for entryen
+        same_next = np.zeros(len(ent), dtype=bool)
+        same_next[:-1] = ~new_group[1:]
+        nxt = np.r_[row[1:], 0]
+        on = val == 1
+        ent, code, row, epoch, same_next, nxt = ent[on], code[on], row[on], epoch[on], same_next[on], nxt[on]
+        reset_at = np.full(len(ent), -1, dtype=np.int64)
+        has_reset = epoch < len(rkey)
+        cand = rkey[np.minimum(epoch, max(len(rkey) - 1, 0))] if len(rkey) else np.zeros(len(ent), dtype=np.int64)
+        has_reset &= (cand // n_rows) == ent
+        reset_at[has_reset] = cand[has_reset] % n_rows
+        end_row = np.where(same_next, nxt, reset_at)
+        by_reset = ~same_next & has_reset
+
+        # slå sammen perioder som fortsetter over en epokestart
+        order = np.lexsort((row, code, ent))
+        ent, code, row, end_row, by_reset = ent[order], code[order], row[order], end_row[order], by_reset[order]
+        cont = np.zeros(len(ent), dtype=bool)
+        cont[1:] = by_reset[:-1] & (ent[1:] == ent[:-1]) & (code[1:] == code[:-1]) & (row[1:] == end_row[:-1])
+        first = np.flatnonzero(~cont)
+        last = np.r_[first[1:] - 1, len(ent) - 1].astype(np.int64) if len(first) else first
+        ent, code, start_row, end_row = ent[first], code[first], row[first], end_row[last]
+
+        closed = end_row >= 0
+        start = self.row_day[start_row]
+        end = np.where(closed, self.row_day[end_row], self.n_days)
+        fixed = closed & (self.row_kind[np.where(closed, end_row, 0)] != KIND_REMOVED)
+        return ent, code, start, end, closed, fixed
+
+    def presence(self):
+        """bool-matrise entry x dag: entry finnes i datasettet."""
+        ent, kind, day = self.row_entry, self.row_kind, self.row_day
+        val = (kind != KIND_REMOVED).astype(np.int8)
+        order = np.lexsort((np.arange(len(ent)), ent))
+        ent, val, day = ent[order], val[order], day[order]
+        keep = np.ones(len(ent), dtype=bool)
+        keep[1:] = (ent[1:] != ent[:-1]) | (val[1:] != val[:-1])
+        ent, val, day = ent[keep], val[keep], day[keep]
+        closed = np.zeros(len(ent), dtype=bool)
+        closed[:-1] = ent[1:] == ent[:-1]
+        end = np.where(closed, np.r_[day[1:], 0], self.n_days)
+        on = val == 1
+        return _fill(self.n_entries, self.n_days, ent[on], day[on], end[on]).astype(bool)
+
+
+def _fill(n_rows, n_days, rows, start, end, dtype=np.int16):
+    """Summer perioder [start, end) per rad -> matrise n_rows x n_days (diff + cumsum)."""
+    size = n_rows * (n_days + 1)
+    d = (np.bincount(rows * (n_days + 1) + start, minlength=size)
+         - np.bincount(rows * (n_days + 1) + end, minlength=size))
+    return np.cumsum(d.reshape(n_rows, n_days + 1).astype(dtype), axis=1, dtype=dtype)[:, :n_days]
+
+
+# ---------- analyser ----------
+def cooccurrence(X):
+    """Antall entries som bryter både krav i og j (diagonalen = antall per krav)."""
+    Xi = X.astype(np.int32)
+    return Xi.T @ Xi
+
+
+def top_pairs(C, n=10):
+    iu = np.triu_indices(N_SC, k=1)
+    vals = C[iu]
+    order = np.argsort(-vals, kind="stable")[:n]
+    return [[arch.WCAG_SC[iu[0][i]], arch.WCAG_SC[iu[1][i]], int(vals[i])] for i in order if vals[i] > 0]
+
+
+def violation_counts(ev, iv):
+    """Antall brutte krav per entry per dag."""
+    ent, _, start, end, _, _ = iv
+    return _fill(ev.n_entries, ev.n_days, ent, start, end)
+
+
+def criterion_counts(ev, iv):
+    """Antall entries som bryter hvert krav per dag (N_SC x dager)."""
+    _, code, start, end, _, _ = iv
+    return _fill(N_SC, ev.n_days, code, start, end, dtype=np.int32)
+
+
+def compliance_curves(ev, counts, present):
+    """Andel entries med 0 brudd per domene per dag (nan når domenet er tomt)."""
+    order = np.argsort(ev.entry_domain, kind="stable")
+    dom = ev.entry_domain[order]
+    starts = np.flatnonzero(np.r_[True, dom[1:] != dom[:-1]])
+    ok = (present & (counts == 0))[order]
+    n_ok = np.add.reduceat(ok, starts, axis=0, dtype=np.int64)
+    n_all = np.add.reduceat(present[order], starts, axis=0, dtype=np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = n_ok / n_all
+    return dom[starts], share
+
+
+def median_time_to_fix(iv):
+    """Median antall dager fra et brudd dukker opp til det er borte, per krav.
+
+    Perioder som slutter fordi erklæringen ble fjernet teller ikke som utbedret.
+    """
+    _, code, start, end, _, fixed = iv
+    code, dur = code[fixed], (end - start)[fixed]
+    order = np.lexsort((dur, code))
+    code, dur = code[order], dur[order]
+    n = np.bincount(code, minlength=N_SC)
+    first = np.cumsum(n) - n
+    has = n > 0
+    lo = first[has] + (n[has] - 1) // 2
+    hi = first[has] + n[has] // 2
+    med = np.full(N_SC, np.nan)
+    med[has] = (dur[lo] + dur[hi]) / 2
+    return med, n
+
+
+def week_over_week(ev, crit, weeks):
+    """Brudd per krav ved utgangen av hver uke (bakover fra siste dag) og endringen fra uka før."""
+    idx = np.arange(ev.n_days - 1, -1, -7)[:weeks + 1][::-1]
+    at = crit[:, idx]
+    return idx, at, np.diff(at, axis=1)
+
+
+# ---------- main ----------
+def _nan_to_none(a, ndigits=3):
+    return [None if np.isnan(x) else round(float(x), ndigits) for x in a]
+
+
+def analyze(weeks=12, top=10):
+    timings = {}
+    t = time.perf_counter()
+    keys, domains, X = load_current()
+    timings["load_current"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    ev = Events(iter_changes())
+    timings["load_changes"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    C = cooccurrence(X)
+    out = {
+        "asOf": arch.today_str(),
+        "entries": len(keys),
+        "criteria": {arch.WCAG_SC[i]: int(C[i, i]) for i in np.flatnonzero(np.diag(C))},
+        "topPairs": top_pairs(C, top),
+    }
+    if ev.n_days and len(ev.ev_row):
+        iv = ev.intervals()
+        counts = violation_counts(ev, iv)
+        present = ev.presence()
+        crit = criterion_counts(ev, iv)
+
+        dom_idx, share = compliance_curves(ev, counts, present)
+        sample = np.arange(ev.n_days - 1, -1, -7)[::-1]   # ukentlige punkter holder filen liten
+        out["compliance"] = {
+            "dates": ev.dates(sample),
+            "domains": {ev.domains[d]: _nan_to_none(share[i, sample]) for i, d in enumerate(dom_idx)},
+        }
+
+        med, n = median_time_to_fix(iv)
+        out["timeToFix"] = {arch.WCAG_SC[i]: {"medianDays": float(med[i]), "fixes": int(n[i])}
+                            for i in np.flatnonzero(n)}
+
+        idx, at, delta = week_over_week(ev, crit, weeks)
+        used = np.flatnonzero(at.any(axis=1))
+        out["weekOverWeek"] = {
+            "weeks": ev.dates(idx),
+            "violations": [int(x) for x in (counts * present).sum(axis=0)[idx]],
+            "byCode": {arch.WCAG_SC[i]: [int(x) for x in delta[i]] for i in used},
+        }
+    timings["compute"] = time.perf_counter() - t
+    return out, ev, timings
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", help="skriv resultatet som JSON hit")
+    ap.add_argument("--weeks", type=int, default=12, help="antall uker i uke-over-uke (default 12)")
+    ap.add_argument("--top", type=int, default=10, help="antall kravpar i samforekomst (default 10)")
+    args = ap.parse_args()
+
+    out, ev, timings = analyze(args.weeks, args.top)
+    print(f"{out['entries']} entries i latest.json, {len(ev.row_entry)} loggrader, "
+          f"{ev.n_entries} erklæringer over {ev.n_days} dager")
+    print("Tid: " + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+    for a, b, n in out["topPairs"][:5]:
+        print(f"  {a} + {b}: {n}")
+    for code, v in sorted(out.get("timeToFix", {}).items(), key=lambda kv: -kv[1]["fixes"])[:5]:
+        print(f"  {code}: median {v['medianDays']:.1f} dager til utbedring ({v['fixes']} utbedringer)")
+
+    if args.out:
+        static_out.write_json(Path(args.out), out)
+        print(f"Skrev {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Felles HTTP-lag for scrape_uustatus.py og enrich_uu_details.py.
+
+- per-host token-bucket (høflighet) og én requests.Session per tråd
+- diskcache nøklet på URL, med ETag/Last-Modified og betingede forespørsler
+  (304 -> gjenbruk lagret body)
+- TTL- og størrelsesbasert opprydding (prune)
+
+Konfig via env:
+  UU_RATE_PER_HOST       forespørsler/sek per host (default 2)
+  UU_BURST_PER_HOST      maks tokens på lager per host (default 2)
+  UU_HTTP_CACHE          "0" slår av cachen
+  UU_HTTP_CACHE_DIR      katalog for cachen (default .cache/uu-http)
+  UU_HTTP_FRESH_SECONDS  så lenge en oppføring brukes uten nettverkskall (default 6 t)
+  UU_HTTP_CACHE_TTL_DAYS oppføringer eldre enn dette slettes (default 30)
+  UU_HTTP_CACHE_MAX_MB   maks total størrelse før eldste slettes (default 256)
+"""
+import hashlib, json, os, threading, time
+from pathlib import Path
+from urllib.parse import urlparse
+import requests
+
+RATE_PER_HOST = float(os.getenv("UU_RATE_PER_HOST", "2"))
+BURST_PER_HOST = max(1.0, float(os.getenv("UU_BURST_PER_HOST", "2")))
+
+CACHE_ENABLED = os.getenv("UU_HTTP_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+CACHE_DIR = Path(os.getenv("UU_HTTP_CACHE_DIR", ".cache/uu-http"))
+FRESH_SECONDS = float(os.getenv("UU_HTTP_FRESH_SECONDS", str(6 * 3600)))
+CACHE_TTL_SECONDS = float(os.getenv("UU_HTTP_CACHE_TTL_DAYS", "30")) * 86400
+CACHE_MAX_BYTES = int(float(os.getenv("UU_HTTP_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+
+class TokenBucket:
+    """Enkel token-bucket: `rate` tokens/sek, maks `burst` på lager."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Response:
+    """Minimal respons (likt navn på felt som requests.Response)."""
+
+    def __init__(self, url, status_code, text, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.from_cache = from_cache
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+_local = threading.local()
+_stats = {"network": 0, "not_modified": 0, "fresh": 0}
+_stats_lock = threading.Lock()
+
+
+def throttle(url):
+    """Vent på tur for hosten til `url`."""
+    host = (urlparse(url).hostname or "").lower()
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = _buckets[host] = TokenBucket(RATE_PER_HOST, BURST_PER_HOST)
+    bucket.acquire()
+
+
+def session():
+    """Én requests.Session per tråd (gjenbruker keep-alive-forbindelser)."""
+    s = getattr(_local, "session", None)
+    if s is None:
+        s = _local.session = requests.Session()
+    return s
+
+
+def _count(kind):
+    with _stats_lock:
+        _stats[kind] += 1
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+# ---------- diskcache ----------
+def _cache_path(url):
+    return CACHE_DIR / (hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+
+def _cache_read(url):
+    fp = _cache_path(url)
+    try:
+        with fp.open("r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except Exception:
+        return None
+    if entry.get("url") != url:
+        return None
+    if time.time() - entry.get("stored_at", 0) > CACHE_TTL_SECONDS:
+        return None
+    return entry
+
+
+def _cache_write(url, entry):
+    fp = _cache_path(url)
+    fp.parent.mkdir(parents=True, exist_ok=True)
+    tmp = fp.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, fp)
+
+
+def fetch(url, headers=None, timeout=30):
+    """Hent `url` via cache + betinget GET. Kaster ved nettverksfeil (som requests)."""
+    entry = _cache_read(url) if CACHE_ENABLED else None
+    if entry and time.time() - entry.get("stored_at", 0) < FRESH_SECONDS:
+        _count("fresh")
+        return Response(url, entry["status"], entry["body"], from_cache=True)
+
+    req_headers = dict(headers or {})
+    if entry:
+        if entry.get("etag"):
+            req_headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            req_headers["If-Modified-Since"] = entry["last_modified"]
+
+    throttle(url)
+    r = session().get(url, headers=req_headers, timeout=timeout)
+
+    if r.status_code == 304 and entry:
+        _count("not_modified")
+        entry["stored_at"] = time.time()
+        _cache_write(url, entry)
+        return Response(url, entry["status"], entry["body"], from_cache=True)
+
+    _count("network")
+    text = r.text
+    if CACHE_ENABLED and r.status_code == 200:
+        _cache_write(url, {
+            "url": url,
+            "status": r.status_code,
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "stored_at": time.time(),
+            "body": text,
+        })
+    return Response(url, r.status_code, text)
+
+
+def prune():
+    """Slett utgåtte oppføringer og de eldste til cachen er under maks størrelse."""
+    if not CACHE_ENABLED or not CACHE_DIR.exists():
+        return
+    now = time.time()
+    files = []
+    for fp in CACHE_DIR.glob("*.json"):
+        try:
+            st = fp.stat()
+        except OSError:
+            continue
+        if now - st.st_mtime > CACHE_TTL_SECONDS:
+            fp.unlink(missing_ok=True)
+            continue
+        files.append((st.st_mtime, st.st_size, fp))
+    total = sum(size for _, size, _ in files)
+    for _, size, fp in sorted(files):
+        if total <= CACHE_MAX_BYTES:
+            break
+        fp.unlink(missing_ok=True)
+        total -= size
+    for tmp in CACHE_DIR.glob("*.tmp"):
+        tmp.unlink(missing_ok=True)